@@ -0,0 +1,103 @@
+import asyncio
+import os
+import time
+from collections import deque
+
+from api.executor import inference_executor
+from api.process import run_hand_batch
+
+# how long the first frame of a batch may wait for others; 0 disables batching
+BATCH_WINDOW_MS = float(os.getenv("BATCH_WINDOW_MS", "5"))
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "16"))
+BATCH_HISTORY = 256
+
+
+def _distribute(items, future):
+    if future.cancelled():
+        return
+    exc = future.exception()
+    results = [exc] * len(items) if exc else future.result()
+    for (_, _, _, item_future, _), result in zip(items, results):
+        if item_future.done():
+            continue
+        if isinstance(result, Exception):
+            item_future.set_exception(result)
+        else:
+            item_future.set_result(result)
+
+
+class BatchScheduler:
+    def __init__(self, executor, window_ms=BATCH_WINDOW_MS, max_size=BATCH_MAX_SIZE):
+        self.executor = executor
+        self.window_ms = window_ms
+        self.max_size = max(1, max_size)
+        self.pending = []
+        self.flush_handle = None
+        self.batches = 0
+        self.frames = 0
+        self.history = deque(maxlen=BATCH_HISTORY)
+
+    async def submit(self, client_id, frame_bytes, ts=None):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.pending.append((client_id, frame_bytes, ts, future, time.perf_counter()))
+        if self.window_ms <= 0 or len(self.pending) >= self.max_size:
+            self.flush()
+        elif self.flush_handle is None:
+            self.flush_handle = loop.call_later(self.window_ms / 1000.0, self.flush)
+        return await future
+
+    def flush(self):
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        batch, self.pending = self.pending, []
+        if not batch:
+            return
+
+        now = time.perf_counter()
+        waits = [(now - enqueued_at) * 1000.0 for _, _, _, _, enqueued_at in batch]
+        self.batches += 1
+        self.frames += len(batch)
+        self.history.append((len(batch), max(waits), sum(waits) / len(waits)))
+
+        # one job per worker keeps every client's frames on the worker that owns its session
+        groups = {}
+        for item in batch:
+            groups.setdefault(self.executor.worker_for(item[0]), []).append(item)
+        for worker, items in groups.items():
+            frames = [(client_id, frame_bytes, ts) for client_id, frame_bytes, ts, _, _ in items]
+            job = self.executor.dispatch(worker, run_hand_batch, frames)
+            job.add_done_callback(lambda future, items=items: _distribute(items, future))
+
+    def discard(self, client_id):
+        # frames of a released client must not reach the worker after its session was closed,
+        # they would quietly build a new one; their callers get the same None as a frame without a result
+        kept = []
+        for item in self.pending:
+            if item[0] != client_id:
+                kept.append(item)
+            elif not item[3].done():
+                item[3].set_result(None)
+        self.pending = kept
+
+    def stats(self):
+        sizes = [size for size, _, _ in self.history]
+        max_waits = [max_wait for _, max_wait, _ in self.history]
+        return {
+            "windowMs": self.window_ms,
+            "maxSize": self.max_size,
+            "batches": self.batches,
+            "frames": self.frames,
+            "avgBatchSize": sum(sizes) / len(sizes) if sizes else 0.0,
+            "maxBatchSize": max(sizes) if sizes else 0,
+            "avgWaitMs": sum(max_waits) / len(max_waits) if max_waits else 0.0,
+            "maxWaitMs": max(max_waits) if max_waits else 0.0,
+            "recent": [
+                {"size": size, "maxWaitMs": round(max_wait, 3), "avgWaitMs": round(avg_wait, 3)}
+                for size, max_wait, avg_wait in list(self.history)[-20:]
+            ],
+        }
+
+
+batch_scheduler = BatchScheduler(inference_executor)
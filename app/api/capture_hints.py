@@ -0,0 +1,54 @@
+import os
+
+CAPTURE_ACTIVE_FPS = float(os.getenv("CAPTURE_ACTIVE_FPS", "10"))
+CAPTURE_ACTIVE_MAX_WIDTH = int(os.getenv("CAPTURE_ACTIVE_MAX_WIDTH", "0"))  # 0 = camera resolution
+CAPTURE_IDLE_FPS = float(os.getenv("CAPTURE_IDLE_FPS", "2"))
+CAPTURE_IDLE_MAX_WIDTH = int(os.getenv("CAPTURE_IDLE_MAX_WIDTH", "320"))
+CAPTURE_IDLE_AFTER_SECONDS = float(os.getenv("CAPTURE_IDLE_AFTER_SECONDS", "2.0"))
+# inference jobs queued on the busiest worker at which active clients are slowed down
+CAPTURE_BUSY_QUEUE_DEPTH = int(os.getenv("CAPTURE_BUSY_QUEUE_DEPTH", "4"))
+
+NO_HAND = "no hand detected"
+
+
+def executor_load(executor):
+    return max(worker.jobs.qsize() for worker in executor.workers) / max(1, CAPTURE_BUSY_QUEUE_DEPTH)
+
+
+class CaptureRateAdvisor:
+    def __init__(self, load_fn, profile_fn=None):
+        self.load_fn = load_fn
+        # the server-wide capture profile, which caps what an active client is asked for
+        self.profile_fn = profile_fn
+        self.sent = 0
+
+    def hint_for(self, state, now):
+        if now < state.command_mode_until:
+            reason = "command"
+        elif now - state.hand_seen_at < CAPTURE_IDLE_AFTER_SECONDS:
+            reason = "hand"
+        else:
+            return {"type": "capture", "fps": CAPTURE_IDLE_FPS, "maxWidth": CAPTURE_IDLE_MAX_WIDTH, "reason": "idle"}
+
+        fps = CAPTURE_ACTIVE_FPS
+        max_width = CAPTURE_ACTIVE_MAX_WIDTH
+        if self.profile_fn is not None:
+            profile = self.profile_fn()
+            fps = min(fps, profile["fps"])
+            max_width = min(max_width, profile["maxWidth"]) if max_width else profile["maxWidth"]
+        if self.load_fn() >= 1.0:
+            # the server is behind, active clients get half rate but never less than idle
+            fps = max(CAPTURE_IDLE_FPS, fps / 2)
+            reason = "busy"
+        return {"type": "capture", "fps": fps, "maxWidth": max_width, "reason": reason}
+
+    def update(self, state, gesture, now):
+        # returns the hint to push when it differs from the one the client already has
+        if gesture and gesture != NO_HAND:
+            state.hand_seen_at = now
+        hint = self.hint_for(state, now)
+        previous, state.capture_hint = state.capture_hint, hint
+        if previous is not None and (previous["fps"], previous["maxWidth"]) == (hint["fps"], hint["maxWidth"]):
+            return None
+        self.sent += 1
+        return hint
@@ -0,0 +1,132 @@
+import os
+import threading
+import time
+
+from api.capture_hints import CAPTURE_ACTIVE_FPS, CAPTURE_IDLE_FPS, CAPTURE_IDLE_MAX_WIDTH
+
+# candidate capture widths, largest first; the landmarker works on ~200 px inputs, more rarely helps
+CAPTURE_PROFILE_WIDTHS = tuple(int(w) for w in os.getenv("CAPTURE_PROFILE_WIDTHS", "960,640,480,320").split(","))
+CAPTURE_PROFILE_JPEG_QUALITY = int(os.getenv("CAPTURE_PROFILE_JPEG_QUALITY", "70"))
+# share of the inference workers' time the profile plans for, the rest is headroom for bursts
+CAPTURE_PROFILE_UTILIZATION = float(os.getenv("CAPTURE_PROFILE_UTILIZATION", "0.7"))
+CAPTURE_PROFILE_REFRESH_SECONDS = float(os.getenv("CAPTURE_PROFILE_REFRESH_SECONDS", "2.0"))
+# webcams are 4:3 or 16:9, the height limit assumes the taller one
+CAPTURE_PROFILE_ASPECT = 3 / 4
+COST_SMOOTHING = 0.05
+
+
+class FrameCostModel:
+    # running averages fed by the inference workers: JPEG decode time per pixel,
+    # landmarker time per frame (its input size is fixed, so it hardly depends on the frame size)
+    def __init__(self, smoothing=COST_SMOOTHING):
+        self.smoothing = smoothing
+        self.lock = threading.Lock()
+        self.decode_per_pixel = None
+        self.detect_per_frame = None
+        self.decodes = 0
+        self.detects = 0
+
+    def _average(self, current, value):
+        return value if current is None else current + self.smoothing * (value - current)
+
+    def observe_decode(self, seconds, pixels):
+        if pixels <= 0:
+            return
+        with self.lock:
+            self.decode_per_pixel = self._average(self.decode_per_pixel, seconds / pixels)
+            self.decodes += 1
+
+    def observe_detect(self, seconds):
+        with self.lock:
+            self.detect_per_frame = self._average(self.detect_per_frame, seconds)
+            self.detects += 1
+
+    def frame_seconds(self, pixels):
+        # None until both costs have been measured
+        with self.lock:
+            if self.decode_per_pixel is None or self.detect_per_frame is None:
+                return None
+            return self.decode_per_pixel * pixels + self.detect_per_frame
+
+    def stats(self):
+        with self.lock:
+            return {
+                "decodeNsPerPixel": round(self.decode_per_pixel * 1e9, 3) if self.decode_per_pixel is not None else None,
+                "detectMs": round(self.detect_per_frame * 1000.0, 3) if self.detect_per_frame is not None else None,
+                "decodes": self.decodes,
+                "detects": self.detects,
+            }
+
+
+frame_costs = FrameCostModel()
+
+
+def frame_pixels(width):
+    return width * round(width * CAPTURE_PROFILE_ASPECT)
+
+
+class CaptureProfileAdvisor:
+    # the capture settings the server asks every client for: the largest width at which all active
+    # clients at the active frame rate fit into the workers' time, recomputed every few seconds
+    def __init__(self, costs, workers_fn, clients_fn, load_fn, widths=CAPTURE_PROFILE_WIDTHS):
+        self.costs = costs
+        self.workers_fn = workers_fn
+        # -> (active clients, idle clients)
+        self.clients_fn = clients_fn
+        self.load_fn = load_fn
+        self.widths = sorted(widths, reverse=True)
+        self.current = None
+        self.computed_at = None
+        self.version = 0
+
+    def profile(self, now=None):
+        now = time.monotonic() if now is None else now
+        if self.computed_at is None or now - self.computed_at >= CAPTURE_PROFILE_REFRESH_SECONDS:
+            self.computed_at = now
+            self.refresh()
+        return self.current
+
+    def refresh(self):
+        width, fps, basis = self.compute()
+        current = self.current
+        if current is None or (current["maxWidth"], current["fps"]) != (width, fps):
+            self.version += 1
+        self.current = {
+            "type": "profile",
+            "version": self.version,
+            "maxWidth": width,
+            "maxHeight": round(width * CAPTURE_PROFILE_ASPECT),
+            "jpegQuality": CAPTURE_PROFILE_JPEG_QUALITY,
+            "fps": fps,
+            "basis": basis,
+        }
+        return self.current
+
+    def compute(self):
+        active, idle = self.clients_fn()
+        workers = self.workers_fn()
+        load = self.load_fn()
+        basis = {**self.costs.stats(), "workers": workers, "activeClients": active, "idleClients": idle, "load": round(load, 2)}
+
+        idle_cost = self.costs.frame_seconds(frame_pixels(CAPTURE_IDLE_MAX_WIDTH))
+        if idle_cost is None:
+            # nothing measured yet
+            return self.widths[0], CAPTURE_ACTIVE_FPS, basis
+
+        # worker seconds per second left for each active client after the idle ones
+        budget = workers * CAPTURE_PROFILE_UTILIZATION - idle * CAPTURE_IDLE_FPS * idle_cost
+        budget /= max(1, active)
+        basis["budgetMsPerClientSecond"] = round(budget * 1000.0, 2)
+
+        widths = self.widths
+        if load >= 1.0 and len(widths) > 1:
+            # the queues are already backing up, skip the largest size until they drain
+            widths = widths[1:]
+        for width in widths:
+            if self.costs.frame_seconds(frame_pixels(width)) * CAPTURE_ACTIVE_FPS <= budget:
+                return width, CAPTURE_ACTIVE_FPS, basis
+
+        # even the smallest size does not fit at the full rate, lower the rate instead
+        width = widths[-1]
+        fps = budget / self.costs.frame_seconds(frame_pixels(width))
+        return width, round(min(CAPTURE_ACTIVE_FPS, max(CAPTURE_IDLE_FPS, fps)), 1), basis
@@ -0,0 +1,220 @@
+import asyncio
+import json
+import os
+import socket
+
+# inprocess: single uvicorn worker; ipc: several workers on one host; redis: several hosts/containers
+EVENT_BUS = os.getenv("EVENT_BUS", "inprocess")
+EVENT_BUS_IPC_DIR = os.getenv("EVENT_BUS_IPC_DIR", "/tmp/gesture-event-bus")
+EVENT_BUS_REDIS_URL = os.getenv("EVENT_BUS_REDIS_URL", "redis://localhost:6379/0")
+EVENT_BUS_CHANNEL_PREFIX = os.getenv("EVENT_BUS_CHANNEL_PREFIX", "gesture:client:")
+IPC_MAX_DATAGRAM = 65536
+
+
+class InProcessEventBus:
+    # every WebSocket lives in this process, events go straight to the local delivery
+    name = "inprocess"
+
+    def __init__(self):
+        self.deliver = None
+        self.local = set()
+        self.published = 0
+        self.received = 0
+
+    async def start(self, deliver):
+        self.deliver = deliver
+
+    async def stop(self):
+        pass
+
+    async def claim(self, client_id):
+        self.local.add(client_id)
+
+    async def release(self, client_id):
+        self.local.discard(client_id)
+
+    async def publish(self, client_id, event):
+        self.published += 1
+        if client_id in self.local:
+            self.received += 1
+            await self.deliver(client_id, event)
+
+    def stats(self):
+        return {"backend": self.name, "localClients": len(self.local), "published": self.published, "received": self.received}
+
+
+class IpcEventBus(InProcessEventBus):
+    # one unix datagram socket per worker process in a shared directory; an event for a client
+    # that is not connected here is sent to every other worker, the one holding the socket delivers it
+    name = "ipc"
+
+    def __init__(self, directory=EVENT_BUS_IPC_DIR):
+        super().__init__()
+        self.directory = directory
+        self.path = os.path.join(directory, f"{os.getpid()}.sock")
+        self.sock = None
+        self.loop = None
+        # the loop only keeps weak references to tasks, deliveries started by _read are held here until done
+        self.deliveries = set()
+
+    async def start(self, deliver):
+        self.deliver = deliver
+        os.makedirs(self.directory, exist_ok=True)
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.sock.bind(self.path)
+        self.sock.setblocking(False)
+        self.loop = asyncio.get_running_loop()
+        self.loop.add_reader(self.sock.fileno(), self._read)
+
+    async def stop(self):
+        if self.sock is None:
+            return
+        self.loop.remove_reader(self.sock.fileno())
+        self.sock.close()
+        self.sock = None
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+    def _read(self):
+        while True:
+            try:
+                data = self.sock.recv(IPC_MAX_DATAGRAM)
+            except (BlockingIOError, InterruptedError):
+                return
+            try:
+                message = json.loads(data)
+                client_id = message["clientId"]
+            except (ValueError, KeyError):
+                continue
+            if client_id in self.local:
+                self.received += 1
+                task = self.loop.create_task(self.deliver(client_id, message["event"]))
+                self.deliveries.add(task)
+                task.add_done_callback(self.deliveries.discard)
+
+    def _peers(self):
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return [
+            os.path.join(self.directory, name)
+            for name in names
+            if name.endswith(".sock") and os.path.join(self.directory, name) != self.path
+        ]
+
+    async def publish(self, client_id, event):
+        self.published += 1
+        if client_id in self.local:
+            self.received += 1
+            await self.deliver(client_id, event)
+            return
+
+        data = json.dumps({"clientId": client_id, "event": event}).encode("utf-8")
+        for peer in self._peers():
+            try:
+                self.sock.sendto(data, peer)
+            except (ConnectionRefusedError, FileNotFoundError):
+                # the worker behind this socket is gone
+                try:
+                    os.unlink(peer)
+                except FileNotFoundError:
+                    pass
+            except BlockingIOError:
+                # the peer is not keeping up; gesture events are not worth blocking the loop for
+                pass
+
+
+class RedisEventBus(InProcessEventBus):
+    # one pub/sub channel per clientId, only the process holding the client's WebSocket subscribes to it;
+    # pass client= to use an already configured client or a local stand-in such as fakeredis
+    name = "redis"
+
+    def __init__(self, url=EVENT_BUS_REDIS_URL, client=None, prefix=EVENT_BUS_CHANNEL_PREFIX):
+        super().__init__()
+        self.url = url
+        self.client = client
+        self.prefix = prefix
+        self.pubsub = None
+        self.listener = None
+
+    async def start(self, deliver):
+        self.deliver = deliver
+        if self.client is None:
+            # only this backend needs the redis package
+            import redis.asyncio as redis
+
+            self.client = redis.from_url(self.url)
+        self.pubsub = self.client.pubsub()
+        self.listener = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        if self.listener is not None:
+            self.listener.cancel()
+            try:
+                await self.listener
+            except asyncio.CancelledError:
+                pass
+            self.listener = None
+        if self.pubsub is not None:
+            close = getattr(self.pubsub, "aclose", None) or self.pubsub.close
+            await close()
+            self.pubsub = None
+
+    async def claim(self, client_id):
+        self.local.add(client_id)
+        await self.pubsub.subscribe(self.prefix + client_id)
+
+    async def release(self, client_id):
+        self.local.discard(client_id)
+        if self.pubsub is not None:
+            await self.pubsub.unsubscribe(self.prefix + client_id)
+
+    async def _listen(self):
+        while True:
+            if not self.pubsub.subscribed:
+                await asyncio.sleep(0.1)
+                continue
+            message = await self.pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+            if message is None or message.get("type") != "message":
+                continue
+            channel = message["channel"]
+            if isinstance(channel, bytes):
+                channel = channel.decode("utf-8")
+            client_id = channel[len(self.prefix):]
+            if client_id not in self.local:
+                continue
+            try:
+                event = json.loads(message["data"])
+            except ValueError:
+                continue
+            self.received += 1
+            try:
+                await self.deliver(client_id, event)
+            except Exception:
+                pass
+
+    async def publish(self, client_id, event):
+        self.published += 1
+        if client_id in self.local:
+            self.received += 1
+            await self.deliver(client_id, event)
+            return
+        await self.client.publish(self.prefix + client_id, json.dumps(event))
+
+
+def create_event_bus(kind=EVENT_BUS):
+    if kind == "inprocess":
+        return InProcessEventBus()
+    if kind == "ipc":
+        return IpcEventBus()
+    if kind == "redis":
+        return RedisEventBus()
+    raise ValueError(f"unknown EVENT_BUS backend: {kind}")
+
+
+event_bus = create_event_bus()
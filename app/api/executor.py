@@ -0,0 +1,149 @@
+import asyncio
+import os
+import queue
+import threading
+import zlib
+
+import cv2
+import numpy as np
+
+from api.process import FrameBuffers, decode_frame_rgb
+from api.sessions import DetectorSession, create_detector
+from models.hand_detectation import HandLandmarker, WARMUP_FRAME_SHAPE
+
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", "2"))
+
+
+def _set_result(future, result):
+    if not future.done():
+        future.set_result(result)
+
+
+def _set_exception(future, exc):
+    if not future.done():
+        future.set_exception(exc)
+
+
+class InferenceWorker:
+    def __init__(self, index):
+        self.index = index
+        self.jobs = queue.SimpleQueue()
+        self.sessions = {}
+        self.buffers = FrameBuffers()
+        self.thread = None
+        # one warmed-up landmarker kept ready so a new client does not pay for building one
+        self.spare = None
+        self.keep_spare = False
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name=f"inference-{self.index}", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.jobs.put(None)
+
+    def session(self, client_id):
+        # sessions are created and used on the worker thread only, so a landmarker is never shared
+        session = self.sessions.get(client_id)
+        if session is None:
+            session = DetectorSession(client_id, buffers=self.buffers, landmarker_factory=self.take_landmarker)
+            self.sessions[client_id] = session
+        return session
+
+    def take_landmarker(self, detector):
+        spare = self.spare
+        if spare is None or spare.running_mode != detector.running_mode:
+            return HandLandmarker.create_from_options(detector.build_options())
+        self.spare = None
+        landmarker, spare._hands = spare._hands, None
+        if self.keep_spare:
+            # rebuilt after the jobs already queued, not in front of them
+            self.jobs.put((InferenceWorker.prepare_spare, (), None, None))
+        return landmarker
+
+    def prepare_spare(self, frames=1):
+        if self.spare is not None:
+            return
+        spare = create_detector()
+        spare.warm_up(frames)
+        self.spare = spare
+
+    def warm_up(self, frames=1):
+        # builds and exercises the spare landmarker plus the decode path on this thread
+        frame = np.zeros(WARMUP_FRAME_SHAPE, np.uint8)
+        decode_frame_rgb(cv2.imencode(".jpg", frame)[1].tobytes(), self.buffers)
+        self.prepare_spare(frames)
+        self.keep_spare = True
+
+    def close_session(self, client_id):
+        session = self.sessions.pop(client_id, None)
+        if session is not None:
+            session.close()
+
+    def _run(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                break
+            fn, args, future, loop = job
+            try:
+                result = fn(self, *args)
+            except Exception as e:
+                if future is not None:
+                    loop.call_soon_threadsafe(_set_exception, future, e)
+            else:
+                if future is not None:
+                    loop.call_soon_threadsafe(_set_result, future, result)
+        for client_id in list(self.sessions):
+            self.close_session(client_id)
+        if self.spare is not None:
+            self.spare.close()
+            self.spare = None
+
+
+class InferenceExecutor:
+    def __init__(self, workers=INFERENCE_WORKERS):
+        self.workers = [InferenceWorker(i) for i in range(max(1, workers))]
+        self.started = False
+
+    def start(self):
+        if self.started:
+            return
+        for worker in self.workers:
+            worker.start()
+        self.started = True
+
+    def shutdown(self):
+        if not self.started:
+            return
+        for worker in self.workers:
+            worker.stop()
+        for worker in self.workers:
+            worker.thread.join(timeout=5)
+        self.started = False
+
+    def worker_for(self, client_id):
+        # every frame of a client goes to the same worker, which keeps them in order
+        index = zlib.crc32(client_id.encode("utf-8")) % len(self.workers)
+        return self.workers[index]
+
+    def dispatch(self, worker, fn, *args):
+        self.start()
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        worker.jobs.put((fn, args, future, loop))
+        return future
+
+    async def submit(self, client_id, fn, *args):
+        return await self.dispatch(self.worker_for(client_id), fn, *args)
+
+    async def warm_up(self, frames=1):
+        await asyncio.gather(*(self.dispatch(worker, InferenceWorker.warm_up, frames) for worker in self.workers))
+
+    def close_session(self, client_id):
+        if not self.started:
+            return
+        self.worker_for(client_id).jobs.put((InferenceWorker.close_session, (client_id,), None, None))
+
+
+inference_executor = InferenceExecutor()
@@ -0,0 +1,81 @@
+import os
+import struct
+
+# Binary frame message on /ws, little endian:
+#   header (20 bytes): magic b"GVFR", version u8, flags u8 (reserved, 0), reserved u16,
+#                      seq u32, capture timestamp f64 (ms, client clock)
+#   payload: the JPEG bytes
+# The client opens with a text {"type": "hello", "protocol": 1, "credits": N} and may only keep as
+# many frames in flight as the "welcome" reply grants (the reply also carries the capture profile,
+# see capture_profile.py); every frame is answered by a text ack
+#   {"type": "ack", "seq": ..., "status": ..., "gesture": ..., "processingMs": ..., "credit": 1}
+# that hands its credit back. Raw JPEG messages without the header are still accepted, unacked.
+FRAME_MAGIC = b"GVFR"
+FRAME_PROTOCOL_VERSION = 1
+FRAME_HEADER = struct.Struct("<4sBBHId")
+
+WS_FRAME_CREDITS = int(os.getenv("WS_FRAME_CREDITS", "2"))
+WS_MAX_FRAME_CREDITS = int(os.getenv("WS_MAX_FRAME_CREDITS", "8"))
+
+# ack statuses on top of the ingest queue outcomes (processed, dropped, stale)
+ACK_UNDECODABLE = "undecodable"
+ACK_REJECTED = "rejected"
+ACK_ERROR = "error"
+
+
+def is_frame_message(data):
+    return data[:4] == FRAME_MAGIC
+
+
+def parse_frame_message(data):
+    if len(data) <= FRAME_HEADER.size:
+        raise ValueError("frame message is too short")
+    magic, version, _, _, seq, capture_ts = FRAME_HEADER.unpack_from(data)
+    if magic != FRAME_MAGIC:
+        raise ValueError("not a frame message")
+    if version != FRAME_PROTOCOL_VERSION:
+        raise ValueError(f"unsupported frame protocol version {version}")
+    return seq, capture_ts, memoryview(data)[FRAME_HEADER.size:]
+
+
+def build_frame_message(seq, payload, capture_ts=0.0):
+    return FRAME_HEADER.pack(FRAME_MAGIC, FRAME_PROTOCOL_VERSION, 0, 0, seq & 0xFFFFFFFF, capture_ts) + bytes(payload)
+
+
+def welcome_message(hello, profile=None):
+    requested = hello.get("credits", WS_FRAME_CREDITS)
+    if not isinstance(requested, int) or requested < 1:
+        requested = WS_FRAME_CREDITS
+    return {
+        "type": "welcome",
+        "protocol": FRAME_PROTOCOL_VERSION,
+        "credits": min(requested, WS_MAX_FRAME_CREDITS),
+        "headerBytes": FRAME_HEADER.size,
+        "profile": profile,
+    }
+
+
+def ack_message(seq, status, gesture, processing_ms, credit=1):
+    return {
+        "type": "ack",
+        "seq": seq,
+        "status": status,
+        "gesture": gesture,
+        "processingMs": round(processing_ms, 2),
+        "credit": credit,
+    }
+
+
+class FrameCredits:
+    def __init__(self, granted=WS_FRAME_CREDITS):
+        self.granted = granted
+        self.in_flight = 0
+
+    def take(self):
+        if self.in_flight >= self.granted:
+            return False
+        self.in_flight += 1
+        return True
+
+    def give_back(self):
+        self.in_flight = max(0, self.in_flight - 1)
@@ -0,0 +1,128 @@
+import asyncio
+
+FRAME_PROCESSED = "processed"
+FRAME_DROPPED = "dropped"
+FRAME_STALE = "stale"
+
+# a frameId this far behind the last accepted one means the client restarted its counter
+FRAME_ID_RESTART_GAP = 100
+
+
+class FrameMailbox:
+    def __init__(self):
+        self.pending = None
+        self.busy = False
+        self.task = None
+        self.last_frame_id = None
+        self.received = 0
+        self.processed = 0
+        self.dropped = 0
+        self.stale = 0
+
+    @property
+    def depth(self):
+        return int(self.pending is not None) + int(self.busy)
+
+    def accepts(self, frame_id):
+        if frame_id is None or self.last_frame_id is None:
+            return True
+        if frame_id > self.last_frame_id:
+            return True
+        return self.last_frame_id - frame_id > FRAME_ID_RESTART_GAP
+
+    def stats(self):
+        return {
+            "depth": self.depth,
+            "received": self.received,
+            "processed": self.processed,
+            "dropped": self.dropped,
+            "stale": self.stale,
+            "lastFrameId": self.last_frame_id,
+        }
+
+
+class IngestQueue:
+    def __init__(self, handler):
+        self.handler = handler
+        self.mailboxes = {}
+        # survive discard() so the totals only ever grow
+        self.totals = {"received": 0, "processed": 0, "dropped": 0, "stale": 0}
+
+    def offer(self, client_id, frame_id, payload, wait=False):
+        box = self.mailboxes.get(client_id)
+        if box is None:
+            box = FrameMailbox()
+            self.mailboxes[client_id] = box
+        box.received += 1
+        self.totals["received"] += 1
+
+        if not box.accepts(frame_id):
+            box.stale += 1
+            self.totals["stale"] += 1
+            return FRAME_STALE
+        if frame_id is not None:
+            box.last_frame_id = frame_id
+
+        future = asyncio.get_running_loop().create_future() if wait else None
+        if box.pending is not None:
+            # latest frame wins: the unprocessed one is superseded
+            _, superseded = box.pending
+            if superseded is not None and not superseded.done():
+                superseded.set_result((FRAME_DROPPED, None))
+            box.dropped += 1
+            self.totals["dropped"] += 1
+        box.pending = (payload, future)
+
+        if not box.busy:
+            box.busy = True
+            box.task = asyncio.create_task(self._drain(client_id, box))
+        return future
+
+    async def submit(self, client_id, frame_id, payload):
+        future = self.offer(client_id, frame_id, payload, wait=True)
+        if future is FRAME_STALE:
+            return FRAME_STALE, None
+        return await future
+
+    async def _drain(self, client_id, box):
+        try:
+            while box.pending is not None:
+                payload, future = box.pending
+                box.pending = None
+                try:
+                    result = await self.handler(client_id, payload)
+                except Exception as e:
+                    if future is not None and not future.done():
+                        future.set_exception(e)
+                    continue
+                box.processed += 1
+                self.totals["processed"] += 1
+                if future is not None and not future.done():
+                    future.set_result((FRAME_PROCESSED, result))
+        finally:
+            box.busy = False
+            box.task = None
+
+    def reset_sequence(self, client_id):
+        # a new connection numbers its frames from the start again
+        box = self.mailboxes.get(client_id)
+        if box is not None:
+            box.last_frame_id = None
+
+    def discard(self, client_id):
+        box = self.mailboxes.pop(client_id, None)
+        if box is not None and box.pending is not None:
+            # the drain task stops after the frame it is on instead of sending this one
+            _, future = box.pending
+            box.pending = None
+            if future is not None and not future.done():
+                future.set_result((FRAME_DROPPED, None))
+
+    def depth(self):
+        return sum(box.depth for box in self.mailboxes.values())
+
+    def stats(self, client_id=None):
+        if client_id is not None:
+            box = self.mailboxes.get(client_id)
+            return box.stats() if box else None
+        return {cid: box.stats() for cid, box in self.mailboxes.items()}
@@ -0,0 +1,58 @@
+import struct
+
+import numpy as np
+
+from models.hand_detectation import HandLandmarks, MAX_HANDS
+
+# Binary landmark packet, little endian:
+#   header (16 bytes): magic b"GVLM", version u8, hand count u8, reserved u16, capture timestamp f64 (ms)
+#   per hand (260 bytes): handedness u8 (0 = Left, 1 = Right), 3 pad bytes, score f32,
+#                         21 x (x, y, z) f32 normalized landmarks
+# Coordinates and handedness are expected in the mirrored (selfie) view, the same way
+# the server reports them after mirror_hands.
+PACKET_MAGIC = b"GVLM"
+PACKET_VERSION = 1
+PACKET_HEADER = struct.Struct("<4sBBHd")
+HAND_DTYPE = np.dtype([
+    ("handedness", "u1"),
+    ("pad", "V3"),
+    ("score", "<f4"),
+    ("landmarks", "<f4", (21, 3)),
+])
+
+
+def is_landmark_packet(data):
+    return data[:4] == PACKET_MAGIC
+
+
+def parse_landmark_packet(data):
+    if len(data) < PACKET_HEADER.size:
+        raise ValueError("landmark packet is too short")
+    magic, version, hand_count, _, capture_ts = PACKET_HEADER.unpack_from(data)
+    if magic != PACKET_MAGIC:
+        raise ValueError("not a landmark packet")
+    if version != PACKET_VERSION:
+        raise ValueError(f"unsupported landmark packet version {version}")
+    if hand_count > MAX_HANDS:
+        raise ValueError(f"too many hands in landmark packet: {hand_count}")
+    if len(data) != PACKET_HEADER.size + hand_count * HAND_DTYPE.itemsize:
+        raise ValueError("landmark packet size does not match its hand count")
+
+    hands = np.frombuffer(data, HAND_DTYPE, count=hand_count, offset=PACKET_HEADER.size)
+    if (hands["handedness"] > 1).any():
+        raise ValueError("invalid handedness in landmark packet")
+    landmarks = HandLandmarks(
+        hands["landmarks"].astype(np.float32),
+        hands["handedness"].astype(np.int8),
+        hands["score"].astype(np.float32),
+    )
+    return landmarks, capture_ts
+
+
+def build_landmark_packet(landmarks, capture_ts):
+    hands = np.zeros(len(landmarks), HAND_DTYPE)
+    hands["handedness"] = landmarks.handedness
+    hands["score"] = landmarks.scores
+    hands["landmarks"] = landmarks.points
+    header = PACKET_HEADER.pack(PACKET_MAGIC, PACKET_VERSION, len(hands), 0, capture_ts)
+    return header + hands.tobytes()
@@ -0,0 +1,136 @@
+import json
+import os
+import re
+
+import numpy as np
+
+from models.hand_detectation import HandLandmarks, MAX_HANDS
+
+# One directory per recorded session, one raw little-endian file per column so every
+# column can be memory-mapped on replay:
+#   timestamps.f64   (frames,)                   capture/processing time in ms
+#   hand_counts.u1   (frames,)
+#   points.f32       (frames, MAX_HANDS, 21, 3)  zero padded past hand_counts
+#   handedness.i1    (frames, MAX_HANDS)
+#   scores.f32       (frames, MAX_HANDS)
+#   meta.json        version, client id, frame count
+STREAM_VERSION = 1
+COLUMNS = {
+    "timestamps": ("timestamps.f64", "<f8", ()),
+    "hand_counts": ("hand_counts.u1", "u1", ()),
+    "points": ("points.f32", "<f4", (MAX_HANDS, 21, 3)),
+    "handedness": ("handedness.i1", "i1", (MAX_HANDS,)),
+    "scores": ("scores.f32", "<f4", (MAX_HANDS,)),
+}
+
+LANDMARK_RECORD_DIR = os.getenv("LANDMARK_RECORD_DIR")
+
+
+def session_dir_name(client_id, started_at):
+    safe_id = re.sub(r"[^A-Za-z0-9_.-]", "_", client_id)[:64]
+    return f"{safe_id}-{int(started_at)}"
+
+
+class LandmarkRecorder:
+    def __init__(self, directory, client_id=""):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.client_id = client_id
+        self.frames = 0
+        self.files = {name: open(os.path.join(directory, filename), "ab") for name, (filename, _, _) in COLUMNS.items()}
+        self.points = np.zeros((MAX_HANDS, 21, 3), np.float32)
+        self.handedness = np.full(MAX_HANDS, -1, np.int8)
+        self.scores = np.zeros(MAX_HANDS, np.float32)
+
+    def append(self, timestamp_ms, landmarks):
+        count = min(len(landmarks), MAX_HANDS)
+        self.points[:] = 0.0
+        self.handedness[:] = -1
+        self.scores[:] = 0.0
+        self.points[:count] = landmarks.points[:count]
+        self.handedness[:count] = landmarks.handedness[:count]
+        self.scores[:count] = landmarks.scores[:count]
+
+        self.files["timestamps"].write(np.float64(timestamp_ms).tobytes())
+        self.files["hand_counts"].write(np.uint8(count).tobytes())
+        self.files["points"].write(self.points.tobytes())
+        self.files["handedness"].write(self.handedness.tobytes())
+        self.files["scores"].write(self.scores.tobytes())
+        self.frames += 1
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+        with open(os.path.join(self.directory, "meta.json"), "w") as f:
+            json.dump({"version": STREAM_VERSION, "clientId": self.client_id, "frames": self.frames}, f)
+
+
+class LandmarkStream:
+    def __init__(self, directory):
+        self.directory = directory
+        meta_path = os.path.join(directory, "meta.json")
+        self.meta = {}
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                self.meta = json.load(f)
+            if self.meta.get("version") != STREAM_VERSION:
+                raise ValueError(f"unsupported landmark stream version {self.meta.get('version')}")
+        self.client_id = self.meta.get("clientId") or os.path.basename(os.path.normpath(directory))
+
+        # the frame count comes from the timestamp column, so unfinished recordings replay too
+        timestamps_path = os.path.join(directory, COLUMNS["timestamps"][0])
+        frames = os.path.getsize(timestamps_path) // 8 if os.path.exists(timestamps_path) else 0
+        self.columns = {}
+        for name, (filename, dtype, shape) in COLUMNS.items():
+            if frames == 0:
+                self.columns[name] = np.zeros((0,) + shape, dtype)
+            else:
+                self.columns[name] = np.memmap(
+                    os.path.join(directory, filename), dtype=dtype, mode="r", shape=(frames,) + shape
+                )
+        self.frames = frames
+
+    def __len__(self):
+        return self.frames
+
+    @property
+    def timestamps(self):
+        return self.columns["timestamps"]
+
+    def landmarks(self, index):
+        count = int(self.columns["hand_counts"][index])
+        return HandLandmarks(
+            np.array(self.columns["points"][index, :count]),
+            np.array(self.columns["handedness"][index, :count]),
+            np.array(self.columns["scores"][index, :count]),
+        )
+
+    def __iter__(self):
+        for index in range(self.frames):
+            yield float(self.columns["timestamps"][index]), self.landmarks(index)
+
+
+def find_streams(root):
+    if os.path.exists(os.path.join(root, COLUMNS["timestamps"][0])):
+        return [root]
+    return sorted(
+        os.path.join(root, name)
+        for name in os.listdir(root)
+        if os.path.exists(os.path.join(root, name, COLUMNS["timestamps"][0]))
+    )
+
+
+async def replay_stream(stream, detector, emit, client_id=None):
+    # feeds recorded landmarks through the gesture rules on the recorded clock, not the wall clock
+    client_id = client_id or stream.client_id
+    events = []
+    for timestamp_ms, landmarks in stream:
+        now = timestamp_ms / 1000.0
+        if len(landmarks):
+            gesture, confidence = detector.detect_gesture(landmarks, now=now)
+        else:
+            gesture, confidence = "no hand detected", 0.0
+        event = await emit(client_id, gesture, confidence, now=now)
+        if event:
+            events.append((timestamp_ms, event))
+    return events
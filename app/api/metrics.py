@@ -0,0 +1,136 @@
+import os
+import threading
+import time
+from bisect import bisect_left
+
+# histogram bounds in seconds, the last bucket is +Inf
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+METRICS_PER_CLIENT = os.getenv("METRICS_PER_CLIENT", "1") == "1"
+
+
+class Histogram:
+    __slots__ = ("counts", "total", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(STAGE_BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(STAGE_BUCKETS, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+def _labels(**labels):
+    inner = ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items())
+    return "{" + inner + "}" if inner else ""
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+class Metrics:
+    def __init__(self, per_client=METRICS_PER_CLIENT):
+        self.per_client = per_client
+        # stages are observed from the inference threads as well as the event loop
+        self.lock = threading.Lock()
+        self.stages = {}
+        self.client_stages = {}
+        self.collectors = []
+
+    def observe(self, stage, seconds, client_id=None):
+        with self.lock:
+            histogram = self.stages.get(stage)
+            if histogram is None:
+                histogram = self.stages[stage] = Histogram()
+            histogram.observe(seconds)
+            if self.per_client and client_id is not None:
+                key = (client_id, stage)
+                histogram = self.client_stages.get(key)
+                if histogram is None:
+                    histogram = self.client_stages[key] = Histogram()
+                histogram.observe(seconds)
+
+    def timer(self, stage, client_id=None):
+        return StageTimer(self, stage, client_id)
+
+    def forget_client(self, client_id):
+        with self.lock:
+            for key in [key for key in self.client_stages if key[0] == client_id]:
+                del self.client_stages[key]
+
+    def collector(self, fn):
+        # fn() returns (name, type, help, [(labels dict, value), ...]) tuples for gauges and counters
+        self.collectors.append(fn)
+        return fn
+
+    def render(self):
+        with self.lock:
+            stages = {stage: _copy(h) for stage, h in self.stages.items()}
+            client_stages = {key: _copy(h) for key, h in self.client_stages.items()}
+
+        lines = []
+        _render_histograms(lines, "gesture_stage_seconds", "Frame pipeline stage latency.",
+                           [({"stage": stage}, h) for stage, h in sorted(stages.items())])
+        if self.per_client:
+            _render_histograms(lines, "gesture_client_stage_seconds", "Frame pipeline stage latency per client.",
+                               [({"client": cid, "stage": stage}, h) for (cid, stage), h in sorted(client_stages.items())])
+        for collect in self.collectors:
+            for name, metric_type, help_text, samples in collect():
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {metric_type}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_labels(**labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+class StageTimer:
+    __slots__ = ("metrics", "stage", "client_id", "started", "elapsed")
+
+    def __init__(self, metrics, stage, client_id):
+        self.metrics = metrics
+        self.stage = stage
+        self.client_id = client_id
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.started
+        self.metrics.observe(self.stage, self.elapsed, self.client_id)
+        return False
+
+
+def _copy(histogram):
+    copy = Histogram()
+    copy.counts = list(histogram.counts)
+    copy.total = histogram.total
+    copy.count = histogram.count
+    return copy
+
+
+def _render_histograms(lines, name, help_text, series):
+    if not series:
+        return
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} histogram")
+    for labels, histogram in series:
+        cumulative = 0
+        for bound, count in zip(STAGE_BUCKETS + (float("inf"),), histogram.counts):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            lines.append(f"{name}_bucket{_labels(**labels, le=le)} {cumulative}")
+        lines.append(f"{name}_sum{_labels(**labels)} {repr(histogram.total)}")
+        lines.append(f"{name}_count{_labels(**labels)} {histogram.count}")
+
+
+metrics = Metrics()
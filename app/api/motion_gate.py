@@ -0,0 +1,72 @@
+import os
+import threading
+
+import cv2
+import numpy as np
+
+# skip inference while no hand was found and the scene has not changed since the last processed frame
+MOTION_GATE = os.getenv("MOTION_GATE", "1") == "1"
+# mean absolute grayscale difference, as a fraction of full scale
+MOTION_THRESHOLD = float(os.getenv("MOTION_THRESHOLD", "0.02"))
+# run inference at least every this many frames even on a static scene
+MOTION_REFRESH_FRAMES = int(os.getenv("MOTION_REFRESH_FRAMES", "10"))
+MOTION_GATE_SIZE = (64, 48)
+
+
+class GateCounters:
+    # shared by the inference threads
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.checked = 0
+        self.skipped = 0
+
+    def add(self, skipped):
+        with self.lock:
+            self.checked += 1
+            self.skipped += int(skipped)
+
+    def skip_ratio(self):
+        return self.skipped / self.checked if self.checked else 0.0
+
+
+gate_counters = GateCounters()
+
+
+class MotionGate:
+    def __init__(self, threshold=MOTION_THRESHOLD, refresh_frames=MOTION_REFRESH_FRAMES):
+        self.threshold = threshold
+        self.refresh_frames = refresh_frames
+        width, height = MOTION_GATE_SIZE
+        self.small = np.empty((height, width, 3), np.uint8)
+        self.gray = np.empty((height, width), np.uint8)
+        # downscaled grayscale of the last frame inference ran on
+        self.reference = None
+        self.skipped_in_row = 0
+        self.checked = 0
+        self.skipped = 0
+
+    def should_skip(self, frame_rgb, had_hands):
+        cv2.resize(frame_rgb, MOTION_GATE_SIZE, dst=self.small, interpolation=cv2.INTER_AREA)
+        cv2.cvtColor(self.small, cv2.COLOR_RGB2GRAY, dst=self.gray)
+        self.checked += 1
+
+        skip = (
+            not had_hands
+            and self.reference is not None
+            and self.skipped_in_row < self.refresh_frames
+            and cv2.norm(self.gray, self.reference, cv2.NORM_L1) / (self.gray.size * 255.0) < self.threshold
+        )
+        if skip:
+            self.skipped_in_row += 1
+            self.skipped += 1
+        else:
+            # this frame goes to inference and becomes the new reference, the buffers swap roles
+            if self.reference is None:
+                self.reference = np.empty_like(self.gray)
+            self.reference, self.gray = self.gray, self.reference
+            self.skipped_in_row = 0
+        gate_counters.add(skip)
+        return skip
+
+    def skip_ratio(self):
+        return self.skipped / self.checked if self.checked else 0.0
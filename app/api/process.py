@@ -1,21 +1,168 @@
+import time
+
 import cv2
-from models.hand_detectation import HandGestureDetector
+import numpy as np
+from models.hand_detectation import detect_gestures
+from api.metrics import metrics
+from api.capture_profile import frame_costs
 # from models.segmentation import BackgroundSegmenter
 
-hand_gesture_detector = HandGestureDetector(min_detection_conf=0.5, min_tracking_conf=0.5)
 # background_segmenter = BackgroundSegmenter()
 
-def process_hand_gesture(frame):
-    frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-    hand_results = hand_gesture_detector.detect_hands(frame_rgb)
+# OpenCV >= 4.10 can decode JPEGs straight to RGB
+IMREAD_COLOR_RGB = getattr(cv2, "IMREAD_COLOR_RGB", None)
+
+
+
+class FrameBuffers:
+    def __init__(self):
+        self.arrays = {}
+
+    def get(self, name, shape, dtype=np.uint8):
+        # reuse one preallocated array per name while the frame size stays the same
+        array = self.arrays.get(name)
+        if array is None or array.shape != shape or array.dtype != dtype:
+            array = np.empty(shape, dtype)
+            self.arrays[name] = array
+        return array
+
+
+def decode_frame_rgb(frame_bytes, buffers=None):
+    img_array = np.frombuffer(frame_bytes, np.uint8)
+    if IMREAD_COLOR_RGB is not None:
+        return cv2.imdecode(img_array, IMREAD_COLOR_RGB)
+
+    img = cv2.imdecode(img_array, cv2.IMREAD_COLOR)
+    if img is None:
+        return None
+    if buffers is None:
+        return cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+    return cv2.cvtColor(img, cv2.COLOR_BGR2RGB, dst=buffers.get("rgb", img.shape))
+
+
+def mirror_hands(landmarks):
+    # same result as running on a horizontally flipped frame, without touching the pixels
+    landmarks.points[:, :, 0] = 1.0 - landmarks.points[:, :, 0]
+    landmarks.handedness = np.where(landmarks.handedness >= 0, 1 - landmarks.handedness, -1).astype(np.int8)
+    return landmarks
+
+
+def detect_landmarks(frame_rgb, session, ts=None):
+    # frame_rgb is the decoded, unflipped camera frame, ts its capture time on the server clock
+    gate = session.motion_gate
+    if gate is not None:
+        with metrics.timer("motion_gate", session.client_id):
+            skip = gate.should_skip(frame_rgb, len(session.last_landmarks) > 0)
+        if skip:
+            session.record(session.last_landmarks, ts)
+            return session.last_landmarks
+
+    with metrics.timer("detect_hands", session.client_id) as timer:
+        landmarks = session.detect_hands(frame_rgb, ts)
+    frame_costs.observe_detect(timer.elapsed)
+    with metrics.timer("mirror", session.client_id):
+        landmarks = mirror_hands(landmarks)
+    session.last_landmarks = landmarks
+    session.record(landmarks, ts)
+    return landmarks
+
+
+def detect_frame_landmarks(frame_bytes, session, buffers=None, ts=None):
+    # encoded frame -> mirrored landmarks, None when the frame does not decode;
+    # repeated frames are answered from the session's result cache without inference
+    cache = session.result_cache
+    byte_key = None
+    if cache is not None:
+        byte_key = cache.byte_key(frame_bytes)
+        landmarks = cache.get(byte_key)
+        if landmarks is not None:
+            return reuse_landmarks(session, landmarks, ts)
+
+    with metrics.timer("decode", session.client_id) as timer:
+        img = decode_frame_rgb(frame_bytes, buffers)
+    if img is None:
+        return None
+    frame_costs.observe_decode(timer.elapsed, img.shape[0] * img.shape[1])
+    if cache is None:
+        return detect_landmarks(img, session, ts)
+    if not cache.perceptual:
+        cache.miss()
+        landmarks = detect_landmarks(img, session, ts)
+        cache.put(byte_key, landmarks)
+        return landmarks
+
+    image_key = cache.image_key(img)
+    landmarks = cache.get(image_key)
+    if landmarks is not None:
+        cache.put(byte_key, landmarks)
+        return reuse_landmarks(session, landmarks, ts)
+    cache.miss()
+    landmarks = detect_landmarks(img, session, ts)
+    cache.put(image_key, landmarks)
+    cache.put(byte_key, landmarks)
+    return landmarks
+
+
+def reuse_landmarks(session, landmarks, ts=None):
+    session.last_landmarks = landmarks
+    session.record(landmarks, ts)
+    return landmarks
+
+
+def classify_landmarks(session, landmarks, ts=None):
+    if not len(landmarks):
+        return "no hand detected", landmarks, 0.0
+    with metrics.timer("detect_gesture", session.client_id):
+        gesture, confidence = session.detector.detect_gesture(landmarks, now=ts)
+    return gesture, landmarks, confidence
+
+
+def process_hand_gesture(frame_rgb, session, ts=None):
+    return classify_landmarks(session, detect_landmarks(frame_rgb, session, ts), ts)
+
+def run_hand_batch(worker, frames):
+    # landmarks first, frame by frame so decodes can share the worker's buffers,
+    # then the gesture rules for the whole batch in one vectorized pass; every frame carries
+    # its own capture time, so the result does not depend on how the frames were batched
+    results = [None] * len(frames)
+    detected = []
+    for i, (client_id, frame_bytes, ts) in enumerate(frames):
+        try:
+            session = worker.session(client_id)
+            landmarks = detect_frame_landmarks(frame_bytes, session, worker.buffers, ts)
+            if landmarks is not None:
+                detected.append((i, session, landmarks, ts))
+        except Exception as e:
+            results[i] = e
 
-    if hand_results.hand_landmarks:
-        gesture, confidence = hand_gesture_detector.detect_gesture(hand_results, frame)
+    for i, _, landmarks, _ in detected:
+        results[i] = ("no hand detected", landmarks, 0.0)
+    with_hands = [item for item in detected if len(item[2])]
+    try:
+        started = time.perf_counter()
+        gestures = detect_gestures(
+            [session.detector for _, session, _, _ in with_hands],
+            [landmarks for _, _, landmarks, _ in with_hands],
+            [ts for _, _, _, ts in with_hands],
+        )
+        # one vectorized pass for the batch, each frame is charged its share
+        if with_hands:
+            share = (time.perf_counter() - started) / len(with_hands)
+            for _, session, _, _ in with_hands:
+                metrics.observe("detect_gesture", share, session.client_id)
+    except Exception as e:
+        for i, _, _, _ in with_hands:
+            results[i] = e
     else:
-        gesture = "no hand detected"
-        confidence = 0.0
+        for (i, _, landmarks, _), (gesture, confidence) in zip(with_hands, gestures):
+            results[i] = (gesture, landmarks, confidence)
+    return results
 
-    return gesture, frame, confidence
+def run_landmark_packet(worker, client_id, landmarks, ts=None):
+    # client-side landmarks skip decode and inference, only the gesture rules run here
+    session = worker.session(client_id)
+    session.record(landmarks, ts)
+    return classify_landmarks(session, landmarks, ts)
 
 # def process_segmentation(frame):
 #     segmented_frame = background_segmenter.segment_background(frame)
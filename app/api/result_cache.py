@@ -0,0 +1,97 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+# per-session LRU of recent landmark results, keyed by the encoded bytes and by a perceptual hash
+RESULT_CACHE = os.getenv("RESULT_CACHE", "1") == "1"
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "16"))
+# the perceptual tier is opt-in: a hash cell is ~75 px wide at 720p, so a small finger move can leave the
+# hash unchanged and the previous landmarks would come back for a frame that differs
+RESULT_CACHE_PERCEPTUAL = os.getenv("RESULT_CACHE_PERCEPTUAL", "0") == "1"
+# Hamming distance in bits at which two difference hashes count as the same frame; 0 = exact match.
+# A larger tolerance also swallows small hand movements, keep it low.
+RESULT_CACHE_MAX_DISTANCE = int(os.getenv("RESULT_CACHE_MAX_DISTANCE", "0"))
+# 16x16 difference hash: 256 bits, fine enough that a moving finger changes it
+DHASH_SIZE = 16
+
+
+class CacheCounters:
+    # shared by the inference threads
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.byte_hits = 0
+        self.phash_hits = 0
+        self.misses = 0
+
+    def add(self, outcome):
+        with self.lock:
+            if outcome == "bytes":
+                self.byte_hits += 1
+            elif outcome == "phash":
+                self.phash_hits += 1
+            else:
+                self.misses += 1
+
+
+cache_counters = CacheCounters()
+
+
+class FrameResultCache:
+    def __init__(self, capacity=RESULT_CACHE_SIZE, max_distance=RESULT_CACHE_MAX_DISTANCE, perceptual=RESULT_CACHE_PERCEPTUAL):
+        self.capacity = max(1, capacity)
+        self.perceptual = perceptual
+        self.max_distance = max_distance
+        self.entries = OrderedDict()
+        self.small = np.empty((DHASH_SIZE, DHASH_SIZE + 1, 3), np.uint8)
+        self.gray = np.empty((DHASH_SIZE, DHASH_SIZE + 1), np.uint8)
+        self.hits = 0
+        self.misses = 0
+
+    def byte_key(self, frame_bytes):
+        # catches byte-identical re-uploads before any decoding
+        return b"b" + hashlib.blake2b(frame_bytes, digest_size=16).digest()
+
+    def image_key(self, frame_rgb):
+        cv2.resize(frame_rgb, (DHASH_SIZE + 1, DHASH_SIZE), dst=self.small, interpolation=cv2.INTER_AREA)
+        cv2.cvtColor(self.small, cv2.COLOR_RGB2GRAY, dst=self.gray)
+        return b"p" + np.packbits(self.gray[:, 1:] > self.gray[:, :-1]).tobytes()
+
+    def get(self, key):
+        landmarks = self.entries.get(key)
+        if landmarks is not None:
+            self.entries.move_to_end(key)
+        elif key[:1] == b"p" and self.max_distance > 0:
+            landmarks = self._nearest(key)
+        if landmarks is None:
+            return None
+        self.hits += 1
+        cache_counters.add("bytes" if key[:1] == b"b" else "phash")
+        return landmarks
+
+    def _nearest(self, key):
+        bits = np.frombuffer(key, np.uint8, offset=1)
+        for other, landmarks in reversed(self.entries.items()):
+            if other[:1] != b"p":
+                continue
+            distance = int(np.unpackbits(bits ^ np.frombuffer(other, np.uint8, offset=1)).sum())
+            if distance <= self.max_distance:
+                return landmarks
+        return None
+
+    def miss(self):
+        self.misses += 1
+        cache_counters.add("miss")
+
+    def put(self, key, landmarks):
+        self.entries[key] = landmarks
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+
+    def hit_ratio(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
@@ -1,12 +1,29 @@
 from datetime import datetime
 from typing import Optional
+import asyncio
+import json
 import time
 from fastapi import APIRouter, UploadFile, File, HTTPException, WebSocket, WebSocketDisconnect, Query, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
 from pydantic import BaseModel
-import cv2
-import numpy as np
-from api.process import process_hand_gesture
-from db import upsert_client
+from api.executor import inference_executor
+from api.batching import batch_scheduler
+from api.process import run_landmark_packet
+from api.landmark_packet import is_landmark_packet, parse_landmark_packet
+from api.ingest import IngestQueue, FRAME_DROPPED, FRAME_PROCESSED, FRAME_STALE
+from api.frame_protocol import (
+    ACK_ERROR, ACK_REJECTED, ACK_UNDECODABLE, FrameCredits, ack_message, is_frame_message,
+    parse_frame_message, welcome_message,
+)
+from api.sessions import SessionRegistry
+from api.metrics import metrics
+from api.event_bus import event_bus
+from api.startup import startup_state
+from api.capture_hints import CaptureRateAdvisor, executor_load
+from api.capture_profile import CaptureProfileAdvisor, frame_costs
+from api.motion_gate import gate_counters
+from api.result_cache import cache_counters
+from db import client_writer
 
 import logging
 
@@ -16,15 +33,32 @@ class ClientRegistration(BaseModel):
     clientId: str
     consentAccepted: Optional[bool] = None
 
-websocket_clients = {}
-gesture_buffers = {}
-gesture_state = {}
 GESTURE_THRESHOLD = 4
 MIN_CONFIDENCE = 0.45
 GESTURE_HOLD_SECONDS = 0.25
 GESTURE_COOLDOWN_SECONDS = 1.0
 COMMAND_MODE_WINDOW_SECONDS = 4.0
 
+client_sessions = SessionRegistry(ring_size=GESTURE_THRESHOLD)
+
+
+def capture_clients():
+    # (active, idle) by the capture rate each client was last told to use; new clients count as active
+    idle = sum(
+        1 for state in client_sessions.clients.values()
+        if state.capture_hint is not None and state.capture_hint["reason"] == "idle"
+    )
+    return len(client_sessions.clients) - idle, idle
+
+
+capture_profiles = CaptureProfileAdvisor(
+    frame_costs,
+    lambda: len(inference_executor.workers),
+    capture_clients,
+    lambda: executor_load(inference_executor),
+)
+capture_advisor = CaptureRateAdvisor(lambda: executor_load(inference_executor), capture_profiles.profile)
+
 # latest_segmented_frame = None
 
 logging.basicConfig(
@@ -69,41 +103,113 @@ async def websocket_endpoint(websocket: WebSocket):
         await websocket.close(code=1008)
         return
     await websocket.accept()
-    existing = websocket_clients.get(client_id)
+    state = client_sessions.touch(client_id)
+    existing = state.websocket
+    state.websocket = websocket
+    frame_queue.reset_sequence(client_id)
     if existing:
         try:
             await existing.close()
         except Exception:
             pass
-    websocket_clients[client_id] = websocket
-    gesture_state.setdefault(client_id, {"command_mode_until": 0.0, "last_sent": {}})
+    await event_bus.claim(client_id)
+    credits = FrameCredits()
+    greeted = False
+    acks = set()
     try:
         while True:
             message = await websocket.receive()
             if message.get("type") == "websocket.disconnect":
                 break
+            client_sessions.touch(client_id)
 
             frame_bytes = message.get("bytes")
             if frame_bytes is None:
-                # ignore text/ping style messages
+                hello = _parse_hello(message.get("text"))
+                if hello is not None:
+                    welcome = welcome_message(hello, capture_profiles.profile())
+                    if greeted:
+                        # a repeated hello gets the profile again but not a second grant on top of the frames in flight
+                        welcome["credits"] = credits.granted
+                    else:
+                        # the same object the in-flight acks give their credits back to
+                        credits.granted = welcome["credits"]
+                        greeted = True
+                    await websocket.send_json(welcome)
+                # ignore other text/ping style messages
+                continue
+
+            if is_landmark_packet(frame_bytes):
+                try:
+                    landmarks, capture_ts = parse_landmark_packet(frame_bytes)
+                    await handle_landmarks(client_id, landmarks, frame_time(client_id, capture_ts))
+                except ValueError:
+                    pass
                 continue
 
-            img_array = np.frombuffer(frame_bytes, np.uint8)
-            img = cv2.imdecode(img_array, cv2.IMREAD_COLOR)
-            if img is None:
+            if is_frame_message(frame_bytes):
+                try:
+                    seq, capture_ts, payload = parse_frame_message(frame_bytes)
+                except ValueError:
+                    continue
+                if not credits.take():
+                    # the client ignored its credit, nothing was consumed so nothing is handed back
+                    await websocket.send_json(ack_message(seq, ACK_REJECTED, None, 0.0, credit=0))
+                    continue
+                ts = frame_time(client_id, capture_ts)
+                task = asyncio.create_task(ack_frame(websocket, client_id, credits, seq, (payload, ts)))
+                acks.add(task)
+                task.add_done_callback(acks.discard)
                 continue
 
-            img = cv2.flip(img, 1)
-            gesture, _, confidence = process_hand_gesture(img)
-            event = await maybe_emit_gesture(client_id, gesture, confidence)
-            if event:
-                await notify_subscribers(client_id, event)
+            # legacy clients send the bare JPEG and get no ack, nor a capture time
+            frame_queue.offer(client_id, None, (frame_bytes, time.monotonic()))
     except WebSocketDisconnect:
         pass
     finally:
-        websocket_clients.pop(client_id, None)
-        gesture_buffers.pop(client_id, None)
-        gesture_state.pop(client_id, None)
+        for task in list(acks):
+            task.cancel()
+        state = client_sessions.get(client_id)
+        if state is not None and state.websocket is websocket:
+            state.websocket = None
+            client_sessions.remove(client_id)
+        # the bus claim is this connection's until a newer socket takes the client over; an eviction
+        # already dropped the session, but the claim still has to go
+        if state is None or state.websocket is None:
+            await event_bus.release(client_id)
+
+
+def _parse_hello(text):
+    if not text:
+        return None
+    try:
+        message = json.loads(text)
+    except ValueError:
+        return None
+    if not isinstance(message, dict) or message.get("type") != "hello":
+        return None
+    return message
+
+
+async def ack_frame(websocket, client_id, credits, seq, payload):
+    started = time.perf_counter()
+    gesture = None
+    try:
+        outcome = frame_queue.offer(client_id, seq, payload, wait=True)
+        if outcome is FRAME_STALE:
+            status = FRAME_STALE
+        else:
+            status, gesture = await outcome
+            if status == FRAME_PROCESSED and gesture is None:
+                status = ACK_UNDECODABLE
+    except Exception:
+        status = ACK_ERROR
+    finally:
+        credits.give_back()
+    try:
+        await websocket.send_json(ack_message(seq, status, gesture, (time.perf_counter() - started) * 1000.0))
+    except Exception:
+        pass
 
 
 @router.post("/register_client")
@@ -113,16 +219,15 @@ async def register_client(payload: ClientRegistration, request: Request):
     client_ip = request.client.host if request.client else None
     origin = request.headers.get("origin") or request.headers.get("referer")
     user_agent = request.headers.get("user-agent")
-    # DB write disabled for now:
-    # upsert_client(
-    #     client_id=payload.clientId,
-    #     consent_accepted=payload.consentAccepted,
-    #     consent_at=datetime.utcnow() if payload.consentAccepted else None,
-    #     client_ip=client_ip,
-    #     origin=origin,
-    #     user_agent=user_agent,
-    #     last_seen_at=datetime.utcnow(),
-    # )
+    client_writer.submit(
+        payload.clientId,
+        consent_accepted=payload.consentAccepted,
+        consent_at=datetime.utcnow() if payload.consentAccepted else None,
+        client_ip=client_ip,
+        origin=origin,
+        user_agent=user_agent,
+        last_seen_at=datetime.utcnow(),
+    )
     return {"message": "registered"}
 
 
@@ -133,70 +238,186 @@ async def client_consent(payload: ClientRegistration, request: Request):
     client_ip = request.client.host if request.client else None
     origin = request.headers.get("origin") or request.headers.get("referer")
     user_agent = request.headers.get("user-agent")
-    # DB write disabled for now:
-    # upsert_client(
-    #     client_id=payload.clientId,
-    #     consent_accepted=payload.consentAccepted,
-    #     consent_at=datetime.utcnow() if payload.consentAccepted else None,
-    #     client_ip=client_ip,
-    #     origin=origin,
-    #     user_agent=user_agent,
-    #     last_seen_at=datetime.utcnow(),
-    # )
+    client_writer.submit(
+        payload.clientId,
+        consent_accepted=payload.consentAccepted,
+        consent_at=datetime.utcnow() if payload.consentAccepted else None,
+        client_ip=client_ip,
+        origin=origin,
+        user_agent=user_agent,
+        last_seen_at=datetime.utcnow(),
+    )
     return {"message": "updated"}
 
 async def notify_subscribers(client_id, gesture):
-    client = websocket_clients.get(client_id)
+    # the client's WebSocket may be held by another worker, the bus routes the event there
+    await event_bus.publish(client_id, {"gesture": gesture})
+
+
+async def deliver_event(client_id, event):
+    state = client_sessions.get(client_id)
+    client = state.websocket if state else None
     if not client:
         return
     try:
-        await client.send_json({"gesture": gesture})
+        with metrics.timer("send", client_id):
+            await client.send_json(event)
     except Exception:
-        websocket_clients.pop(client_id, None)
-        gesture_buffers.pop(client_id, None)
-        gesture_state.pop(client_id, None)
+        state.websocket = None
+        client_sessions.remove(client_id)
+        await event_bus.release(client_id)
+
 
+@client_sessions.on_release
+def release_client(client_id):
+    frame_queue.discard(client_id)
+    batch_scheduler.discard(client_id)
+    inference_executor.close_session(client_id)
+    metrics.forget_client(client_id)
 
-async def maybe_emit_gesture(client_id, gesture, confidence):
+
+async def maybe_emit_gesture(client_id, gesture, confidence, now=None):
     if not gesture or gesture in {"None", "no hand detected", "Normal"}:
         return None
     if confidence < MIN_CONFIDENCE:
         return None
 
-    now = time.monotonic()
-    state = gesture_state.setdefault(client_id, {"command_mode_until": 0.0, "last_sent": {}})
-    buffer = gesture_buffers.setdefault(client_id, [])
-
-    buffer.append((gesture, now))
-    if len(buffer) > GESTURE_THRESHOLD:
-        buffer.pop(0)
+    now = time.monotonic() if now is None else now
+    state = client_sessions.touch(client_id, now)
+    state.push_gesture(gesture, now)
 
-    if len(buffer) < GESTURE_THRESHOLD:
+    if not state.ring_full():
         return None
 
-    first_gesture, first_ts = buffer[0]
+    first_gesture, first_ts = state.oldest_gesture()
     if first_gesture != gesture:
         return None
-    if any(g != gesture for g, _ in buffer):
+    if not state.ring_all(gesture):
         return None
     if now - first_ts < GESTURE_HOLD_SECONDS:
         return None
 
-    last_sent_ts = state["last_sent"].get(gesture, 0.0)
+    last_sent_ts = state.last_sent.get(gesture, 0.0)
     if now - last_sent_ts < GESTURE_COOLDOWN_SECONDS:
         return None
 
     if gesture == "Pointing":
-        state["command_mode_until"] = now + COMMAND_MODE_WINDOW_SECONDS
-        state["last_sent"][gesture] = now
+        state.command_mode_until = now + COMMAND_MODE_WINDOW_SECONDS
+        state.last_sent[gesture] = now
         return gesture
 
-    if gesture in {"Swipe Left", "Swipe Right"} and now > state["command_mode_until"]:
+    if gesture in {"Swipe Left", "Swipe Right"} and now > state.command_mode_until:
+        return None
+
+    state.last_sent[gesture] = now
+    return gesture
+
+
+def frame_time(client_id, capture_ts_ms):
+    # the frame's capture time on the server clock; the gesture rules run on it instead of on
+    # the time the result happens to come back from the executor
+    state = client_sessions.touch(client_id)
+    return state.frame_time(capture_ts_ms, time.monotonic())
+
+
+async def handle_frame(client_id, payload):
+    frame_bytes, ts = payload
+    result = await batch_scheduler.submit(client_id, frame_bytes, ts)
+    if result is None:
         return None
 
-    state["last_sent"][gesture] = now
+    return await emit_result(client_id, result, ts)
+
+
+async def handle_landmarks(client_id, landmarks, ts=None):
+    result = await inference_executor.submit(client_id, run_landmark_packet, client_id, landmarks, ts)
+    return await emit_result(client_id, result, ts)
+
+
+async def emit_result(client_id, result, ts=None):
+    gesture, _, confidence = result
+
+    # frame-level logging disabled for performance
+    # print(gesture)
+
+    # nem statikus gesztust egybol kuldje el
+    # if gesture == "swipe right" or gesture == "swipe left":
+    #     await notify_subscribers(gesture)
+
+    # else:
+    with metrics.timer("maybe_emit_gesture", client_id):
+        event = await maybe_emit_gesture(client_id, gesture, confidence, ts)
+    if event:
+        await notify_subscribers(client_id, event)
+
+    state = client_sessions.get(client_id)
+    if state is not None:
+        hint = capture_advisor.update(state, gesture, time.monotonic())
+        if hint:
+            await event_bus.publish(client_id, hint)
     return gesture
 
+
+frame_queue = IngestQueue(handle_frame)
+
+
+@metrics.collector
+def pipeline_gauges():
+    sessions = client_sessions.stats()
+    ingest = frame_queue.stats()
+    bus = event_bus.stats()
+    client_skip_ratios = []
+    client_hit_ratios = []
+    if metrics.per_client:
+        for worker in inference_executor.workers:
+            # sessions belong to the worker thread, copy before iterating
+            for client_id, session in list(worker.sessions.items()):
+                if session.motion_gate is not None:
+                    client_skip_ratios.append(({"client": client_id}, session.motion_gate.skip_ratio()))
+                if session.result_cache is not None:
+                    client_hit_ratios.append(({"client": client_id}, session.result_cache.hit_ratio()))
+    profile = capture_profiles.profile()
+    capture_modes = {"idle": 0, "hand": 0, "command": 0, "busy": 0}
+    for state in client_sessions.clients.values():
+        if state.capture_hint is not None:
+            capture_modes[state.capture_hint["reason"]] += 1
+    return [
+        ("gesture_active_sessions", "gauge", "Clients tracked by the session registry.",
+         [({}, sessions["clients"])]),
+        ("gesture_active_websockets", "gauge", "Clients with an open WebSocket.",
+         [({}, sessions["websockets"])]),
+        ("gesture_ingest_queue_depth", "gauge", "Frames pending or in flight in the ingest mailboxes.",
+         [({}, frame_queue.depth())] + [({"client": cid}, box["depth"]) for cid, box in ingest.items()]),
+        ("gesture_capture_mode_clients", "gauge", "Clients by the capture rate they were last told to use.",
+         [({"reason": reason}, count) for reason, count in capture_modes.items()]),
+        ("gesture_capture_profile_max_width", "gauge", "Capture width the server currently asks clients for.",
+         [({}, profile["maxWidth"])]),
+        ("gesture_capture_profile_fps", "gauge", "Capture rate the server currently asks active clients for.",
+         [({}, profile["fps"])]),
+        ("gesture_batch_queue_depth", "gauge", "Frames waiting for the batch window.",
+         [({}, len(batch_scheduler.pending))]),
+        ("gesture_executor_queue_depth", "gauge", "Jobs queued per inference worker.",
+         [({"worker": str(worker.index)}, worker.jobs.qsize()) for worker in inference_executor.workers]),
+        ("gesture_event_bus_events_total", "counter", "Gesture events published and delivered through the event bus.",
+         [({"backend": bus["backend"], "direction": "published"}, bus["published"]),
+          ({"backend": bus["backend"], "direction": "received"}, bus["received"])]),
+        ("gesture_motion_gate_frames_total", "counter", "Frames checked by the motion gate by outcome.",
+         [({"outcome": "skipped"}, gate_counters.skipped),
+          ({"outcome": "inferred"}, gate_counters.checked - gate_counters.skipped)]),
+        ("gesture_motion_gate_skip_ratio", "gauge", "Share of gated frames that skipped inference.",
+         [({}, gate_counters.skip_ratio())] + client_skip_ratios),
+        ("gesture_result_cache_lookups_total", "counter", "Result cache lookups by outcome, one per frame.",
+         [({"outcome": "byte_hit"}, cache_counters.byte_hits),
+          ({"outcome": "phash_hit"}, cache_counters.phash_hits),
+          ({"outcome": "miss"}, cache_counters.misses)]),
+        ("gesture_client_result_cache_hit_ratio", "gauge", "Share of frames answered from the result cache per client.",
+         client_hit_ratios),
+        ("gesture_frames_total", "counter", "Frames offered to the ingest queue by outcome.",
+         [({"outcome": outcome}, count) for outcome, count in frame_queue.totals.items()]),
+        ("gesture_client_frames_dropped_total", "counter", "Frames superseded before processing per client.",
+         [({"client": cid}, box["dropped"]) for cid, box in ingest.items()]),
+    ]
+
 # async def notify_subscribers(gesture):
 #     global last_gesture, last_time_sent
 #     now = asyncio.get_event_loop().time()
@@ -214,44 +435,93 @@ async def maybe_emit_gesture(client_id, gesture, confidence):
 #     await asyncio.sleep(3)
 
 @router.post("/process_frame")
-async def process_frame(frame: UploadFile = File(...), clientId: str = Query(""), request: Request = None):
+async def process_frame(
+    frame: UploadFile = File(...),
+    clientId: str = Query(""),
+    frameId: Optional[int] = Query(None),
+    captureTs: Optional[float] = Query(None),
+    request: Request = None,
+):
     # global latest_segmented_frame
     try:
         if not clientId:
             raise HTTPException(status_code=400, detail="clientId is required")
-        # DB write disabled for now:
-        # if request is not None:
-        #     upsert_client(
-        #         client_id=clientId,
-        #         origin=request.headers.get("origin") or request.headers.get("referer"),
-        #         user_agent=request.headers.get("user-agent"),
-        #         client_ip=request.client.host if request.client else None,
-        #         last_seen_at=datetime.utcnow(),
-        #     )
-        img_array = np.frombuffer(await frame.read(), np.uint8)
-        # img_bytes = await frame.read()
-        # print(len(img_bytes))  # Megnézheted, hogy hány byte-ot sikerült beolvasni
-        # if len(img_bytes) == 0:
+        # write-behind: only updates an in-memory row, the flush happens off the frame path
+        if request is not None:
+            client_writer.submit(
+                clientId,
+                origin=request.headers.get("origin") or request.headers.get("referer"),
+                user_agent=request.headers.get("user-agent"),
+                client_ip=request.client.host if request.client else None,
+                last_seen_at=datetime.utcnow(),
+            )
+        frame_bytes = await frame.read()
+        # print(len(frame_bytes))  # Megnézheted, hogy hány byte-ot sikerült beolvasni
+        # if len(frame_bytes) == 0:
         #     raise HTTPException(status_code=400, detail="No image data received")
-        # img_array = np.frombuffer(img_bytes, np.uint8)
-        img = cv2.imdecode(img_array, cv2.IMREAD_COLOR)
-        img = cv2.flip(img, 1)
-
-        gesture, img, confidence = process_hand_gesture(img)
-
-        # frame-level logging disabled for performance
-        # print(gesture)
-
-        # nem statikus gesztust egybol kuldje el
-        # if gesture == "swipe right" or gesture == "swipe left":
-        #     await notify_subscribers(gesture)
-        
-        # else:
-        event = await maybe_emit_gesture(clientId, gesture, confidence)
-        if event:
-            await notify_subscribers(clientId, event)
+        status, gesture = await frame_queue.submit(clientId, frameId, (frame_bytes, frame_time(clientId, captureTs)))
+        if status == FRAME_DROPPED:
+            return {"message": "frame dropped"}
+        if status == FRAME_STALE:
+            return {"message": "stale frame"}
+        if gesture is None:
+            return {"error": "could not decode frame"}
 
         return {"message": "frame processed"}
 
     except Exception as e:
         return {"error": str(e)}
+
+
+@router.post("/ingest_landmarks")
+async def ingest_landmarks(request: Request, clientId: str = Query("")):
+    if not clientId:
+        raise HTTPException(status_code=400, detail="clientId is required")
+    try:
+        landmarks, capture_ts = parse_landmark_packet(await request.body())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    gesture = await handle_landmarks(clientId, landmarks, frame_time(clientId, capture_ts))
+    return {"message": "landmarks processed", "gesture": gesture}
+
+
+@router.get("/ingest_stats")
+async def ingest_stats(clientId: Optional[str] = Query(None)):
+    if clientId:
+        stats = frame_queue.stats(clientId)
+        if stats is None:
+            raise HTTPException(status_code=404, detail="unknown clientId")
+        return stats
+    return {"clients": frame_queue.stats()}
+
+
+@router.get("/batch_stats")
+async def batch_stats():
+    return batch_scheduler.stats()
+
+
+@router.get("/session_stats")
+async def session_stats():
+    return {**client_sessions.stats(), "db": client_writer.stats()}
+
+
+@router.get("/metrics")
+async def metrics_endpoint():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+@router.get("/capture_profile")
+async def capture_profile():
+    # what a client should capture at: size, JPEG quality and rate, from the measured decode and
+    # inference cost and the number of active clients; WebSocket clients get it in the welcome
+    return capture_profiles.profile()
+
+
+@router.get("/healthz")
+async def healthz():
+    return {"status": "ok"}
+
+
+@router.get("/readyz")
+async def readyz():
+    return JSONResponse(startup_state.report(), status_code=200 if startup_state.ready else 503)
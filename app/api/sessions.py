@@ -0,0 +1,292 @@
+import asyncio
+import math
+import os
+import sys
+import time
+from collections import OrderedDict
+
+import numpy as np
+from mediapipe.tasks.python.vision import RunningMode
+
+from api.landmark_stream import LANDMARK_RECORD_DIR, LandmarkRecorder, session_dir_name
+from api.motion_gate import MOTION_GATE, MotionGate
+from api.result_cache import RESULT_CACHE, FrameResultCache
+from models.hand_detectation import HandGestureDetector, HandLandmarks
+
+# ROI mode: run the next frame on a crop around the last hand box
+HAND_ROI_MODE = os.getenv("HAND_ROI_MODE", "0") == "1"
+HAND_ROI_EXPAND = float(os.getenv("HAND_ROI_EXPAND", "1.8"))
+HAND_ROI_MIN_SIZE = int(os.getenv("HAND_ROI_MIN_SIZE", "160"))
+HAND_ROI_REFRESH_FRAMES = int(os.getenv("HAND_ROI_REFRESH_FRAMES", "15"))
+
+SESSION_IDLE_TTL_SECONDS = float(os.getenv("SESSION_IDLE_TTL_SECONDS", "300"))
+SESSION_MAX_CLIENTS = int(os.getenv("SESSION_MAX_CLIENTS", "1000"))
+SESSION_SWEEP_INTERVAL_SECONDS = 5.0
+# a capture clock this far from the arrival clock is re-anchored (client restart, clock jump)
+CLOCK_REANCHOR_SECONDS = 5.0
+
+
+def create_detector(roi_mode=HAND_ROI_MODE, landmarker_factory=None):
+    # crops move between frames, which would confuse the VIDEO tracker
+    return HandGestureDetector(
+        min_detection_conf=0.5,
+        min_tracking_conf=0.5,
+        running_mode=RunningMode.IMAGE if roi_mode else RunningMode.VIDEO,
+        landmarker_factory=landmarker_factory,
+    )
+
+
+class DetectorSession:
+    def __init__(self, client_id, roi_mode=HAND_ROI_MODE, buffers=None, landmarker_factory=None,
+                 motion_gate=MOTION_GATE, result_cache=RESULT_CACHE):
+        self.client_id = client_id
+        self.roi_mode = roi_mode
+        self.buffers = buffers
+        self.detector = create_detector(roi_mode, landmarker_factory)
+        self.last_timestamp_ms = -1
+        self.frames = 0
+        self.roi = None
+        self.roi_frames = 0
+        self.roi_hits = 0
+        self.roi_misses = 0
+        self.motion_gate = MotionGate() if motion_gate else None
+        self.result_cache = FrameResultCache() if result_cache else None
+        # last inference result, reused for frames the motion gate skips
+        self.last_landmarks = HandLandmarks.empty()
+        self.recorder = None
+        if LANDMARK_RECORD_DIR:
+            directory = os.path.join(LANDMARK_RECORD_DIR, session_dir_name(client_id, time.time()))
+            self.recorder = LandmarkRecorder(directory, client_id)
+
+    def next_timestamp_ms(self, ts=None):
+        # detect_for_video rejects timestamps that do not strictly increase
+        timestamp_ms = int((time.monotonic() if ts is None else ts) * 1000)
+        if timestamp_ms <= self.last_timestamp_ms:
+            timestamp_ms = self.last_timestamp_ms + 1
+        self.last_timestamp_ms = timestamp_ms
+        self.frames += 1
+        return timestamp_ms
+
+    def record(self, landmarks, ts=None):
+        if self.recorder is not None:
+            self.recorder.append((time.monotonic() if ts is None else ts) * 1000.0, landmarks)
+
+    def detect_hands(self, frame_rgb, ts=None):
+        timestamp_ms = self.next_timestamp_ms(ts)
+        if not self.roi_mode:
+            return self.detector.detect_landmarks(frame_rgb, timestamp_ms)
+
+        landmarks = None
+        if self.roi is not None and self.roi_frames < HAND_ROI_REFRESH_FRAMES:
+            landmarks = self._detect_in_roi(frame_rgb, timestamp_ms)
+            if len(landmarks):
+                self.roi_hits += 1
+                self.roi_frames += 1
+            else:
+                self.roi_misses += 1
+                landmarks = None
+
+        if landmarks is None:
+            # first frame, a miss inside the crop, or the periodic full-frame refresh
+            landmarks = self.detector.detect_landmarks(frame_rgb, timestamp_ms)
+            self.roi_frames = 0
+
+        self.roi = self._next_roi(landmarks, frame_rgb.shape)
+        return landmarks
+
+    def _detect_in_roi(self, frame_rgb, timestamp_ms):
+        h, w = frame_rgb.shape[:2]
+        x0, y0, x1, y1 = self.roi
+        if self.buffers is not None:
+            crop = self.buffers.get("roi", (y1 - y0, x1 - x0, 3))
+            np.copyto(crop, frame_rgb[y0:y1, x0:x1])
+        else:
+            crop = np.ascontiguousarray(frame_rgb[y0:y1, x0:x1])
+        landmarks = self.detector.detect_landmarks(crop, timestamp_ms)
+
+        # map crop-normalized landmarks back to full-frame coordinates
+        landmarks.points[:, :, 0] = (landmarks.points[:, :, 0] * (x1 - x0) + x0) / w
+        landmarks.points[:, :, 1] = (landmarks.points[:, :, 1] * (y1 - y0) + y0) / h
+        return landmarks
+
+    def _next_roi(self, landmarks, image_shape):
+        if not len(landmarks):
+            return None
+        h, w = image_shape[:2]
+        boxes = landmarks.hand_boxes(image_shape)
+        x_min, y_min = boxes[:, :2].min(axis=0)
+        x_max, y_max = boxes[:, 2:].max(axis=0)
+
+        size = max(x_max - x_min, y_max - y_min) * HAND_ROI_EXPAND
+        size = int(min(max(size, HAND_ROI_MIN_SIZE), w, h))
+        cx, cy = int(x_min + x_max) // 2, int(y_min + y_max) // 2
+        x0 = min(max(cx - size // 2, 0), w - size)
+        y0 = min(max(cy - size // 2, 0), h - size)
+        if size >= w and size >= h:
+            return None
+        return x0, y0, x0 + size, y0 + size
+
+    def close(self):
+        self.detector.close()
+        if self.recorder is not None:
+            self.recorder.close()
+            self.recorder = None
+
+
+class ClientState:
+    # per-client gesture state; the gesture buffer is a fixed-size ring
+    __slots__ = (
+        "client_id",
+        "websocket",
+        "last_seen",
+        "command_mode_until",
+        "last_sent",
+        "ring_gestures",
+        "ring_times",
+        "ring_head",
+        "ring_count",
+        "hand_seen_at",
+        "capture_hint",
+        "clock_offset",
+    )
+
+    def __init__(self, client_id, ring_size, now):
+        self.client_id = client_id
+        self.websocket = None
+        self.last_seen = now
+        self.command_mode_until = 0.0
+        self.last_sent = {}
+        self.ring_gestures = [None] * ring_size
+        self.ring_times = [0.0] * ring_size
+        self.ring_head = 0
+        self.ring_count = 0
+        # a new client starts at the full capture rate
+        self.hand_seen_at = now
+        self.capture_hint = None
+        self.clock_offset = None
+
+    def frame_time(self, capture_ts_ms, arrival):
+        # maps the client's capture timestamp onto the server clock with one fixed offset per client,
+        # so gesture timing follows the capture spacing and not queueing or batching delays
+        # NaN or inf would poison the offset for good, abs(nan) never exceeds the re-anchor limit
+        if not capture_ts_ms or not math.isfinite(capture_ts_ms) or capture_ts_ms <= 0:
+            return arrival
+        capture = capture_ts_ms / 1000.0
+        if self.clock_offset is None or abs(capture + self.clock_offset - arrival) > CLOCK_REANCHOR_SECONDS:
+            self.clock_offset = arrival - capture
+        return capture + self.clock_offset
+
+    def push_gesture(self, gesture, ts):
+        size = len(self.ring_gestures)
+        self.ring_gestures[self.ring_head] = gesture
+        self.ring_times[self.ring_head] = ts
+        self.ring_head = (self.ring_head + 1) % size
+        self.ring_count = min(self.ring_count + 1, size)
+
+    def ring_full(self):
+        return self.ring_count == len(self.ring_gestures)
+
+    def oldest_gesture(self):
+        index = (self.ring_head - self.ring_count) % len(self.ring_gestures)
+        return self.ring_gestures[index], self.ring_times[index]
+
+    def ring_all(self, gesture):
+        return self.ring_full() and all(g == gesture for g in self.ring_gestures)
+
+    def approx_bytes(self):
+        size = sys.getsizeof(self) + sys.getsizeof(self.client_id)
+        size += sys.getsizeof(self.last_sent) + sys.getsizeof(self.ring_gestures) + sys.getsizeof(self.ring_times)
+        size += sum(sys.getsizeof(ts) for ts in self.ring_times)
+        return size
+
+
+class SessionRegistry:
+    def __init__(self, ring_size, idle_ttl=SESSION_IDLE_TTL_SECONDS, max_clients=SESSION_MAX_CLIENTS):
+        self.ring_size = ring_size
+        self.idle_ttl = idle_ttl
+        self.max_clients = max(1, max_clients)
+        # least recently seen first
+        self.clients = OrderedDict()
+        self.release_callbacks = []
+        self.last_sweep = 0.0
+        self.evicted_idle = 0
+        self.evicted_lru = 0
+
+    def on_release(self, callback):
+        self.release_callbacks.append(callback)
+        return callback
+
+    def get(self, client_id):
+        return self.clients.get(client_id)
+
+    def touch(self, client_id, now=None):
+        now = time.monotonic() if now is None else now
+        state = self.clients.get(client_id)
+        if state is None:
+            state = ClientState(client_id, self.ring_size, now)
+            self.clients[client_id] = state
+            self._enforce_cap(client_id)
+        else:
+            state.last_seen = now
+            self.clients.move_to_end(client_id)
+        if now - self.last_sweep >= SESSION_SWEEP_INTERVAL_SECONDS:
+            self.evict_idle(now)
+        return state
+
+    def remove(self, client_id):
+        state = self.clients.pop(client_id, None)
+        if state is not None:
+            self._release(state)
+        return state
+
+    def evict_idle(self, now=None):
+        now = time.monotonic() if now is None else now
+        self.last_sweep = now
+        for client_id, state in list(self.clients.items()):
+            if now - state.last_seen < self.idle_ttl:
+                break
+            # a connected WebSocket keeps the session alive even without frames
+            if state.websocket is not None:
+                continue
+            self.clients.pop(client_id)
+            self.evicted_idle += 1
+            self._release(state)
+
+    def _enforce_cap(self, keep):
+        # the client just inserted is never the victim, touch() hands its state back to the caller
+        while len(self.clients) > self.max_clients:
+            victim = next((cid for cid, state in self.clients.items() if cid != keep and state.websocket is None), None)
+            if victim is None:
+                victim = next(cid for cid in self.clients if cid != keep)
+            self.evicted_lru += 1
+            self._release(self.clients.pop(victim))
+
+    def _release(self, state):
+        if state.websocket is not None:
+            websocket, state.websocket = state.websocket, None
+            try:
+                asyncio.get_running_loop().create_task(_close_quietly(websocket))
+            except RuntimeError:
+                pass
+        for callback in self.release_callbacks:
+            callback(state.client_id)
+
+    def stats(self):
+        total_bytes = sum(state.approx_bytes() for state in self.clients.values())
+        return {
+            "clients": len(self.clients),
+            "websockets": sum(1 for state in self.clients.values() if state.websocket is not None),
+            "maxClients": self.max_clients,
+            "idleTtlSeconds": self.idle_ttl,
+            "evictedIdle": self.evicted_idle,
+            "evictedLru": self.evicted_lru,
+            "approxBytes": total_bytes,
+            "approxBytesPerClient": total_bytes / len(self.clients) if self.clients else 0,
+        }
+
+
+async def _close_quietly(websocket):
+    try:
+        await websocket.close()
+    except Exception:
+        pass
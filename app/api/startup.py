@@ -0,0 +1,62 @@
+import asyncio
+import logging
+import os
+import time
+from contextlib import contextmanager
+
+from models.hand_detectation import HAND_MODEL_PATH, load_model_buffer
+
+WARMUP_FRAMES = int(os.getenv("WARMUP_FRAMES", "2"))
+
+
+class StartupState:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = []
+        self.ready = False
+        self.error = None
+
+    def record(self, name, since):
+        self.started = min(self.started, since)
+        self.phases.append((name, (time.perf_counter() - since) * 1000.0))
+
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, (time.perf_counter() - started) * 1000.0))
+
+    def breakdown(self):
+        return {name: round(ms, 1) for name, ms in self.phases}
+
+    def log(self):
+        total_ms = (time.perf_counter() - self.started) * 1000.0
+        parts = " ".join(f"{name}={ms:.1f}ms" for name, ms in self.phases)
+        logging.info(f"startup: {parts} total={total_ms:.1f}ms ready={self.ready}")
+
+    def report(self):
+        return {
+            "ready": self.ready,
+            "error": self.error,
+            "phases": self.breakdown(),
+            "uptimeSeconds": round(time.perf_counter() - self.started, 1),
+        }
+
+
+startup_state = StartupState()
+
+
+async def warm_up(executor, frames=WARMUP_FRAMES):
+    # readiness flips only after every inference worker has a warmed-up landmarker
+    try:
+        with startup_state.phase("model_buffer"):
+            await asyncio.to_thread(load_model_buffer, HAND_MODEL_PATH)
+        with startup_state.phase("warm_up"):
+            await executor.warm_up(frames)
+        startup_state.ready = True
+    except Exception as e:
+        startup_state.error = str(e)
+        logging.exception("warm-up failed")
+    startup_state.log()
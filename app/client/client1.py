@@ -1,8 +1,10 @@
 import cv2
 import requests
 import time
+import uuid
 import numpy as np
 from app.models.segmentation import BackgroundSegmenter
+from app.client.frame_stream import FrameStream, HttpTransport
 from fastapi import FastAPI, Request
 import uvicorn
 import threading
@@ -10,9 +12,10 @@ import threading
 SERVER_URL = "http://127.0.0.1:8000"
 WEBHOOK_URL = "http://127.0.0.1:9001/webhook"
 BACKGROUND_IMG_PATH = "app/pictures/background.jpg"
+CLIENT_ID = f"client1-{uuid.uuid4().hex[:8]}"
 
 app = FastAPI()
-background_segmenter = BackgroundSegmenter(BACKGROUND_IMG_PATH)
+background_segmenter = BackgroundSegmenter(cv2.imread(BACKGROUND_IMG_PATH))
 
 @app.post("/webhook")
 async def webhook(request: Request):
@@ -35,15 +38,10 @@ def send_frames():
         print("Error: Cannot open webcam!")
         return
 
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            print("Error: Cannot read frame!")
-            break
-
-        _, img_encoded = cv2.imencode('.jpg', frame)
-        requests.post(f"{SERVER_URL}/process_frame", files={"frame": img_encoded.tobytes()})
+    # capture stays on this thread, encoding and sending run behind it
+    stream = FrameStream(cap, HttpTransport(SERVER_URL, CLIENT_ID))
 
+    def show(frame):
         segmented_frame = background_segmenter.segment_background(frame)
 
         if segmented_frame is not None:
@@ -52,9 +50,11 @@ def send_frames():
         if cv2.waitKey(10) == 27:
             print("ESC pressed, unsubscribing...")
             unsubscribe_webhook()
-            break
+            stream.stop()
 
-        # time.sleep(0.05)
+    stream.on_frame = show
+    stream.run()
+    print(f"Stream stats: {stream.stats_snapshot()}")
 
     cap.release()
     cv2.destroyAllWindows()
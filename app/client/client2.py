@@ -1,12 +1,15 @@
 import cv2
 import requests
 import time
+import uuid
 from fastapi import FastAPI, Request
 import uvicorn
 import threading
+from app.client.frame_stream import FrameStream, HttpTransport
 
 SERVER_URL = "http://127.0.0.1:8000"
 WEBHOOK_URL = "http://127.0.0.1:9002/webhook"
+CLIENT_ID = f"client2-{uuid.uuid4().hex[:8]}"
 
 app = FastAPI()
 
@@ -31,21 +34,13 @@ def send_frames():
         print("Error: Cannot open webcam!")
         return
 
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            print("Error: Cannot read frame!")
-            break
-
-        _, img_encoded = cv2.imencode('.jpg', frame)
-        requests.post(f"{SERVER_URL}/process_frame", files={"frame": img_encoded.tobytes()})
-
-        if cv2.waitKey(1) == 27:
-            print("ESC pressed, unsubscribing...")
-            unsubscribe_webhook()
-            break
-
-        time.sleep(0.1)
+    stream = FrameStream(cap, HttpTransport(SERVER_URL, CLIENT_ID), max_fps=10)
+    try:
+        stream.run()
+    except KeyboardInterrupt:
+        print("Interrupted, unsubscribing...")
+        unsubscribe_webhook()
+    print(f"Stream stats: {stream.stats_snapshot()}")
 
     cap.release()
 
@@ -0,0 +1,318 @@
+import json
+import threading
+import time
+from collections import deque
+
+import cv2
+import requests
+from requests.adapters import HTTPAdapter
+
+from app.api.frame_protocol import FRAME_PROTOCOL_VERSION, WS_FRAME_CREDITS, build_frame_message
+
+JPEG_QUALITY = 80
+HTTP_SENDERS = 2
+STATS_WINDOW = 120
+
+
+class LatestSlot:
+    # a one-frame queue between two stages: a new item replaces the one not yet taken
+    def __init__(self):
+        self.item = None
+        self.closed = False
+        self.replaced = 0
+        self.condition = threading.Condition()
+
+    def put(self, item):
+        with self.condition:
+            if self.item is not None:
+                self.replaced += 1
+            self.item = item
+            self.condition.notify()
+
+    def take(self):
+        with self.condition:
+            while self.item is None and not self.closed:
+                self.condition.wait()
+            item, self.item = self.item, None
+            return item
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+
+class StreamStats:
+    def __init__(self, window=STATS_WINDOW):
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+        self.counts = {"captured": 0, "encoded": 0, "sent": 0, "answered": 0, "errors": 0}
+        self.stage_times = {"capture": deque(maxlen=window), "encode": deque(maxlen=window), "send": deque(maxlen=window)}
+        self.latencies = deque(maxlen=window)
+        self.last_error = None
+
+    def count(self, name, stage=None):
+        with self.lock:
+            self.counts[name] += 1
+            if stage is not None:
+                self.stage_times[stage].append(time.monotonic())
+
+    def error(self, seq, exc):
+        with self.lock:
+            self.counts["errors"] += 1
+            self.last_error = {
+                "seq": seq,
+                "error": f"{type(exc).__name__}: {exc}",
+                "atSeconds": round(time.monotonic() - self.started, 1),
+            }
+
+    def latency(self, ms):
+        with self.lock:
+            self.counts["answered"] += 1
+            self.latencies.append(ms)
+
+    def snapshot(self, dropped=None):
+        with self.lock:
+            fps = {}
+            for stage, times in self.stage_times.items():
+                span = times[-1] - times[0] if len(times) > 1 else 0.0
+                fps[stage] = round((len(times) - 1) / span, 2) if span > 0 else 0.0
+            latencies = sorted(self.latencies)
+            snapshot = dict(self.counts)
+            snapshot["lastError"] = self.last_error
+        snapshot["fps"] = fps
+        snapshot["latencyMs"] = {
+            "p50": round(latencies[len(latencies) // 2], 2) if latencies else None,
+            "p95": round(latencies[int(len(latencies) * 0.95)], 2) if latencies else None,
+        }
+        snapshot["dropped"] = dropped or {}
+        snapshot["uptimeSeconds"] = round(time.monotonic() - self.started, 1)
+        return snapshot
+
+
+class HttpTransport:
+    # POST /process_frame over one keep-alive session, several requests may be in flight
+    senders = HTTP_SENDERS
+
+    def __init__(self, server_url, client_id, pool_size=HTTP_SENDERS, timeout=5.0):
+        self.url = f"{server_url.rstrip('/')}/process_frame"
+        self.client_id = client_id
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.on_event = None
+
+    def connect(self, stats):
+        self.stats = stats
+        try:
+            profile = self.session.get(self.url.replace("/process_frame", "/capture_profile"), timeout=self.timeout).json()
+        except (requests.RequestException, ValueError):
+            return
+        if self.on_event is not None:
+            self.on_event(profile)
+
+    def send(self, seq, jpeg, capture_ts):
+        started = time.perf_counter()
+        response = self.session.post(
+            self.url,
+            params={"clientId": self.client_id, "frameId": seq, "captureTs": capture_ts},
+            files={"frame": ("frame.jpg", jpeg, "image/jpeg")},
+            timeout=self.timeout,
+        )
+        self.stats.latency((time.perf_counter() - started) * 1000.0)
+        return response.json()
+
+    def close(self):
+        self.session.close()
+
+
+class WebSocketTransport:
+    # /ws with the GVFR frame protocol: sends wait for a credit, acks hand it back and carry the latency;
+    # gesture and capture hint messages go to on_event
+    senders = 1
+
+    def __init__(self, server_url, client_id, credits=WS_FRAME_CREDITS, on_event=None):
+        base = server_url.rstrip("/").replace("http://", "ws://", 1).replace("https://", "wss://", 1)
+        self.url = f"{base}/ws?clientId={client_id}"
+        self.requested = credits
+        self.on_event = on_event
+        self.ws = None
+        self.credits = 0
+        self.sent_at = {}
+        self.condition = threading.Condition()
+        self.reader = None
+
+    def connect(self, stats):
+        # only this transport needs the websockets package
+        from websockets.sync.client import connect
+
+        self.stats = stats
+        self.ws = connect(self.url)
+        self.ws.send(json.dumps({"type": "hello", "protocol": FRAME_PROTOCOL_VERSION, "credits": self.requested}))
+        welcome = json.loads(self.ws.recv())
+        self.credits = welcome.get("credits", 1)
+        if welcome.get("profile") and self.on_event is not None:
+            self.on_event(welcome["profile"])
+        self.reader = threading.Thread(target=self._read, name="ws-reader", daemon=True)
+        self.reader.start()
+
+    def send(self, seq, jpeg, capture_ts):
+        with self.condition:
+            while self.credits <= 0 and self.ws is not None:
+                self.condition.wait()
+            if self.ws is None:
+                raise ConnectionError("WebSocket closed")
+            self.credits -= 1
+            self.sent_at[seq & 0xFFFFFFFF] = time.perf_counter()
+        self.ws.send(build_frame_message(seq, jpeg, capture_ts))
+
+    def _read(self):
+        try:
+            for text in self.ws:
+                message = json.loads(text)
+                if message.get("type") == "ack":
+                    with self.condition:
+                        self.credits += message.get("credit", 0)
+                        sent_at = self.sent_at.pop(message.get("seq"), None)
+                        self.condition.notify()
+                    if sent_at is not None:
+                        self.stats.latency((time.perf_counter() - sent_at) * 1000.0)
+                elif self.on_event is not None:
+                    self.on_event(message)
+        except Exception:
+            pass
+        finally:
+            with self.condition:
+                self.ws = None
+                self.condition.notify_all()
+
+    def close(self):
+        ws = self.ws
+        if ws is not None:
+            ws.close()
+
+
+class FrameStream:
+    # capture -> encode -> send, each on its own thread and joined by latest-wins slots, so a slow
+    # network or server drops stale frames instead of stalling the camera
+    def __init__(self, capture, transport, jpeg_quality=JPEG_QUALITY, max_width=0, max_fps=0, on_frame=None, on_result=None):
+        self.capture = capture
+        self.transport = transport
+        self.jpeg_quality = jpeg_quality
+        self.max_width = max_width
+        self.max_fps = max_fps
+        self.on_frame = on_frame
+        self.on_result = on_result
+        self.stats = StreamStats()
+        self.to_encode = LatestSlot()
+        self.to_send = LatestSlot()
+        self.running = False
+        self.threads = []
+        self.seq = 0
+        self.seq_lock = threading.Lock()
+        forward = transport.on_event
+        transport.on_event = lambda message: self._on_event(message, forward)
+
+    def start(self):
+        # capture on a thread of its own as well, for callers with their own main loop
+        self._start_stages()
+        thread = threading.Thread(target=self._capture_loop, name="frame-capture", daemon=True)
+        thread.start()
+        self.threads.append(thread)
+        return self
+
+    def run(self):
+        # capture on the calling thread, so on_frame may use cv2.imshow
+        self._start_stages()
+        try:
+            self._capture_loop()
+        finally:
+            self.stop()
+
+    def stop(self):
+        self.running = False
+        self.to_encode.close()
+        self.to_send.close()
+        self.transport.close()
+
+    def stats_snapshot(self):
+        return self.stats.snapshot({"beforeEncode": self.to_encode.replaced, "beforeSend": self.to_send.replaced})
+
+    def _start_stages(self):
+        self.transport.connect(self.stats)
+        self.running = True
+        stages = [("frame-encode", self._encode_loop)]
+        stages += [(f"frame-send-{i}", self._send_loop) for i in range(self.transport.senders)]
+        for name, target in stages:
+            thread = threading.Thread(target=target, name=name, daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def _capture_loop(self):
+        last = 0.0
+        while self.running:
+            ret, frame = self.capture.read()
+            if not ret:
+                break
+            now = time.monotonic()
+            if self.max_fps and now - last < 1.0 / self.max_fps:
+                if self.on_frame is not None:
+                    self.on_frame(frame)
+                continue
+            last = now
+            self.stats.count("captured", "capture")
+            self.to_encode.put((frame, now * 1000.0))
+            if self.on_frame is not None:
+                self.on_frame(frame)
+        self.running = False
+
+    def _encode_loop(self):
+        while True:
+            item = self.to_encode.take()
+            if item is None:
+                return
+            frame, capture_ts = item
+            # max_width bounds the longer side, like the server's capture profile means it
+            h, w = frame.shape[:2]
+            long_side = max(h, w)
+            if self.max_width and long_side > self.max_width:
+                scale = self.max_width / long_side
+                frame = cv2.resize(frame, (round(w * scale), round(h * scale)), interpolation=cv2.INTER_AREA)
+            ok, encoded = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+            if not ok:
+                continue
+            self.stats.count("encoded", "encode")
+            self.to_send.put((encoded.tobytes(), capture_ts))
+
+    def _send_loop(self):
+        while True:
+            item = self.to_send.take()
+            if item is None:
+                return
+            jpeg, capture_ts = item
+            with self.seq_lock:
+                self.seq += 1
+                seq = self.seq
+            try:
+                result = self.transport.send(seq, jpeg, capture_ts)
+            except Exception as e:
+                # failures are counted and the latest one kept for stats_snapshot(), the stream goes on
+                self.stats.error(seq, e)
+                if not self.running:
+                    return
+                continue
+            self.stats.count("sent", "send")
+            if result is not None and self.on_result is not None:
+                self.on_result(result)
+
+    def _on_event(self, message, forward):
+        # the server's capture profile and hints steer the frame rate, size and JPEG quality
+        if message.get("type") in ("capture", "profile"):
+            self.max_fps = message.get("fps") or 0
+            self.max_width = message.get("maxWidth") or 0
+        if message.get("jpegQuality"):
+            self.jpeg_quality = message["jpegQuality"]
+        if forward is not None:
+            forward(message)
@@ -6,14 +6,19 @@ import numpy as np
 import threading
 from PIL import Image, ImageTk
 import os
+import uuid
 from app.models.segmentation import BackgroundSegmenter
-from pdf2image import convert_from_path
+from app.client.frame_stream import FrameStream, WebSocketTransport
+from app.client.page_source import ImagePageSource, PdfPageSource
 from pptx import Presentation
 from fastapi import FastAPI, Request
 import uvicorn
 
 SERVER_URL = "http://127.0.0.1:8000"
 WEBHOOK_URL = "http://127.0.0.1:9001/webhook"
+CLIENT_ID = f"gui-{uuid.uuid4().hex[:8]}"
+
+DISPLAY_SIZE = (600, 400)
 
 background_segmenter = None
 scaling_factor = 1.0
@@ -23,11 +28,10 @@ root.title("Edge AI Vision")
 root.geometry("800x600")
 
 current_image = None
-pdf_images = []
-ppt_slides = []
+pages = None
 current_page = 0
-ppt_current_slide = 0
 cap = None
+stream = None
 camera_active = False
 webhook_subscribed = False
 
@@ -35,7 +39,7 @@ def display_image(image):
     global current_image
     if image is not None:
         img = Image.fromarray(image)
-        img = img.resize((600, 400))
+        img = img.resize(DISPLAY_SIZE)
         img_tk = ImageTk.PhotoImage(img)
 
         if current_image is None:
@@ -46,12 +50,12 @@ def display_image(image):
             current_image.configure(image=img_tk)
             current_image.image = img_tk
 
-def convert_to_image(file_path):
+def open_pages(file_path):
     ext = os.path.splitext(file_path)[1].lower()
 
     if ext == '.pdf':
-        images = convert_from_path(file_path)
-        return [np.array(image) for image in images]
+        # rendered page by page at display width, neighbours prefetched
+        return PdfPageSource(file_path, DISPLAY_SIZE[0])
     
     elif ext == '.pptx':
         prs = Presentation(file_path)
@@ -62,70 +66,57 @@ def convert_to_image(file_path):
                     if hasattr(shape, "image"):
                         img = np.array(shape.image)
                         slides.append(img)
-        return slides
+        return ImagePageSource(slides)
     
     return None
 
+def set_background(image):
+    global background_segmenter
+    # the segmentation model is loaded once, page turns only swap the background
+    if background_segmenter is None:
+        background_segmenter = BackgroundSegmenter(image)
+    else:
+        background_segmenter.set_background(image)
+
 def open_file():
-    global background_segmenter, pdf_images, ppt_slides, current_page, ppt_current_slide
+    global pages, current_page
     file_path = filedialog.askopenfilename(filetypes=[("Images", "*.jpg;*.png"), ("PDF", "*.pdf"), ("PPT", "*.pptx")])
     
     if file_path:
         ext = os.path.splitext(file_path)[1].lower()
 
+        if pages is not None:
+            pages.close()
+            pages = None
         if ext == '.pdf' or ext == '.pptx':
-            images = convert_to_image(file_path)
-            if ext == '.pdf':
-                pdf_images = images
-                current_page = 0
-            elif ext == '.pptx':
-                ppt_slides = images
-                ppt_current_slide = 0
-            image = images[0]
+            pages = open_pages(file_path)
+            current_page = 0
+            image = pages.get(0) if len(pages) else None
         else:
             image = cv2.imread(file_path)
         
         if image is not None:
-            background_segmenter = BackgroundSegmenter(image)
+            set_background(image)
             display_image(image)
         # else:
             # messagebox.showerror("Error", "Failed to load image from file.")
 
+def show_page(index):
+    global current_page
+    if pages is None or not 0 <= index < len(pages):
+        return
+    current_page = index
+    image = pages.get(index)
+    set_background(image)
+    # while the webcam runs, send_frames shows the composited frame over the new page
+    if not camera_active:
+        display_image(image)
+
 def next_page(event=None):
-    global current_page, ppt_current_slide, pdf_images, ppt_slides, background_segmenter
-
-    if pdf_images:
-        if current_page < len(pdf_images) - 1:
-            current_page += 1
-            image = pdf_images[current_page]
-            background_segmenter = BackgroundSegmenter(image)
-            segmented_image = background_segmenter.segment_background(image)
-            display_image(segmented_image)
-    elif ppt_slides:
-        if ppt_current_slide < len(ppt_slides) - 1:
-            ppt_current_slide += 1
-            image = ppt_slides[ppt_current_slide]
-            background_segmenter = BackgroundSegmenter(image)
-            segmented_image = background_segmenter.segment_background(image)
-            display_image(segmented_image)
+    show_page(current_page + 1)
 
 def previous_page(event=None):
-    global current_page, ppt_current_slide, pdf_images, ppt_slides, background_segmenter
-
-    if pdf_images:
-        if current_page > 0:
-            current_page -= 1
-            image = pdf_images[current_page]
-            background_segmenter = BackgroundSegmenter(image)
-            segmented_image = background_segmenter.segment_background(image)
-            display_image(segmented_image)
-    elif ppt_slides:
-        if ppt_current_slide > 0:
-            ppt_current_slide -= 1
-            image = ppt_slides[ppt_current_slide]
-            background_segmenter = BackgroundSegmenter(image)
-            segmented_image = background_segmenter.segment_background(image)
-            display_image(segmented_image)
+    show_page(current_page - 1)
 
 def subscribe_webhook():
     global webhook_subscribed
@@ -156,7 +147,7 @@ def unsubscribe_webhook():
         # messagebox.showerror("Error", "Failed to unsubscribe from webhook.")
 
 def start_webcam():
-    global cap, camera_active
+    global cap, stream, camera_active
     if camera_active:
         return
     
@@ -165,37 +156,35 @@ def start_webcam():
         # messagebox.showerror("Error", "Cannot open webcam!")
         return
     
+    # frames go over /ws, which also brings the gesture events back
+    transport = WebSocketTransport(SERVER_URL, CLIENT_ID, on_event=on_server_event)
+    stream = FrameStream(cap, transport, on_frame=show_frame).start()
     camera_active = True
-    threading.Thread(target=send_frames, daemon=True).start()
 
 def stop_webcam():
-    global cap, camera_active
+    global cap, stream, camera_active
     if not camera_active:
         return
     
     camera_active = False
+    stream.stop()
+    print(f"Stream stats: {stream.stats_snapshot()}")
+    stream = None
     cap.release()
     cv2.destroyAllWindows()
 
-def send_frames():
-    global cap
-    while camera_active:
-        ret, frame = cap.read()
-        if not ret:
-            print("Error: Cannot read frame!")
-            break
-        
-        _, img_encoded = cv2.imencode('.jpg', frame)
-        requests.post(f"{SERVER_URL}/process_frame", files={"frame": img_encoded.tobytes()})
-
-        if background_segmenter is not None:
-            segmented_frame = background_segmenter.segment_background(frame)
-            if segmented_frame is not None:
-                display_image(segmented_frame)
+def show_frame(frame):
+    if background_segmenter is not None:
+        segmented_frame = background_segmenter.segment_background(frame)
+        if segmented_frame is not None:
+            display_image(segmented_frame)
 
-        if cv2.waitKey(1) == 27:
-            stop_webcam()
-            break
+def on_server_event(message):
+    gesture = str(message.get("gesture", "")).lower()
+    if gesture == "swipe right":
+        root.after(0, next_page)
+    elif gesture == "swipe left":
+        root.after(0, previous_page)
 
 app = FastAPI()
 
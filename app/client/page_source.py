@@ -0,0 +1,154 @@
+import os
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+import numpy as np
+
+PAGE_CACHE_BYTES = int(os.getenv("PAGE_CACHE_BYTES", str(128 * 1024 * 1024)))
+# pages rendered ahead of and behind the current one
+PAGE_PREFETCH = int(os.getenv("PAGE_PREFETCH", "1"))
+
+
+class PageCache:
+    # rendered pages by index, least recently used dropped first once over max_bytes
+    def __init__(self, max_bytes=PAGE_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.pages = OrderedDict()
+        self.bytes = 0
+        self.lock = threading.Lock()
+
+    def get(self, index):
+        with self.lock:
+            page = self.pages.get(index)
+            if page is not None:
+                self.pages.move_to_end(index)
+            return page
+
+    def put(self, index, page):
+        with self.lock:
+            old = self.pages.pop(index, None)
+            if old is not None:
+                self.bytes -= old.nbytes
+            self.pages[index] = page
+            self.bytes += page.nbytes
+            # the page just stored is kept even if it alone is over the budget
+            while self.bytes > self.max_bytes and len(self.pages) > 1:
+                _, evicted = self.pages.popitem(last=False)
+                self.bytes -= evicted.nbytes
+
+    def __contains__(self, index):
+        with self.lock:
+            return index in self.pages
+
+
+class PageSource(ABC):
+    # renders pages on demand and the neighbours of the last requested page on a background thread
+    def __init__(self, page_count, cache=None, prefetch=PAGE_PREFETCH):
+        self.page_count = page_count
+        self.cache = cache or PageCache()
+        self.prefetch = prefetch
+        self.lock = threading.Lock()
+        self.wanted = []
+        self.rendering = {}
+        self.wakeup = threading.Event()
+        self.closed = False
+        self.thread = None
+        if prefetch > 0:
+            self.thread = threading.Thread(target=self._prefetch_loop, name="page-prefetch", daemon=True)
+            self.thread.start()
+
+    def __len__(self):
+        return self.page_count
+
+    @abstractmethod
+    def render(self, index):
+        pass
+
+    def get(self, index):
+        page = self._load(index)
+        self._schedule(index)
+        return page
+
+    def _load(self, index):
+        page = self.cache.get(index)
+        if page is not None:
+            return page
+        with self.lock:
+            done = self.rendering.get(index)
+            owner = done is None
+            if owner:
+                done = threading.Event()
+                self.rendering[index] = done
+        if not owner:
+            # the prefetch thread is already on it
+            done.wait()
+            page = self.cache.get(index)
+            if page is not None:
+                return page
+            return self._load(index)
+        try:
+            page = self.render(index)
+            self.cache.put(index, page)
+        finally:
+            with self.lock:
+                self.rendering.pop(index, None)
+            done.set()
+        return page
+
+    def _schedule(self, index):
+        # nearest neighbours first, the previous request's leftovers are dropped
+        wanted = []
+        for distance in range(1, self.prefetch + 1):
+            for neighbour in (index + distance, index - distance):
+                if 0 <= neighbour < self.page_count and neighbour not in self.cache:
+                    wanted.append(neighbour)
+        with self.lock:
+            self.wanted = wanted
+        if wanted:
+            self.wakeup.set()
+
+    def _prefetch_loop(self):
+        while True:
+            self.wakeup.wait()
+            if self.closed:
+                return
+            with self.lock:
+                if not self.wanted:
+                    self.wakeup.clear()
+                    continue
+                index = self.wanted.pop(0)
+            try:
+                self._load(index)
+            except Exception as e:
+                print(f"Prefetching page {index + 1} failed: {e}")
+
+    def close(self):
+        self.closed = True
+        self.wakeup.set()
+
+
+class PdfPageSource(PageSource):
+    # pages are rasterized one at a time, scaled to the display width, instead of the whole deck up front
+    def __init__(self, path, width, cache=None, prefetch=PAGE_PREFETCH):
+        from pdf2image import pdfinfo_from_path
+
+        self.path = path
+        self.width = width
+        super().__init__(int(pdfinfo_from_path(path)["Pages"]), cache, prefetch)
+
+    def render(self, index):
+        from pdf2image import convert_from_path
+
+        images = convert_from_path(self.path, first_page=index + 1, last_page=index + 1, size=(self.width, None))
+        return np.array(images[0])
+
+
+class ImagePageSource(PageSource):
+    # already decoded images, e.g. the pictures of a pptx
+    def __init__(self, images):
+        self.images = images
+        super().__init__(len(images), PageCache(max_bytes=0), prefetch=0)
+
+    def render(self, index):
+        return self.images[index]
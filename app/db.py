@@ -1,3 +1,5 @@
+import asyncio
+import logging
 import os
 from datetime import datetime
 
@@ -12,8 +14,18 @@ from sqlalchemy import (
     create_engine,
 )
 from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 
+# postgresql+psycopg2://... in Docker, sqlite:///gesture.db works for local testing
 DATABASE_URL = os.getenv("DATABASE_URL")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_FLUSH_INTERVAL_SECONDS = float(os.getenv("DB_FLUSH_INTERVAL_SECONDS", "1.0"))
+DB_MAX_PENDING_CLIENTS = int(os.getenv("DB_MAX_PENDING_CLIENTS", "10000"))
+DB_FLUSH_BATCH_SIZE = int(os.getenv("DB_FLUSH_BATCH_SIZE", "500"))
+# SQLite's default bound-parameter limit on older builds
+SQLITE_MAX_VARIABLES = 999
+
+UPDATABLE_COLUMNS = ("consent_accepted", "consent_at", "client_ip", "origin", "user_agent", "last_seen_at")
 
 metadata = MetaData()
 
@@ -32,7 +44,17 @@ client_sessions = Table(
     Column("last_seen_at", DateTime, nullable=True),
 )
 
-engine = create_engine(DATABASE_URL) if DATABASE_URL else None
+
+
+def _create_engine(url):
+    if not url:
+        return None
+    if url.startswith("sqlite"):
+        return create_engine(url)
+    return create_engine(url, pool_size=DB_POOL_SIZE, max_overflow=DB_POOL_SIZE, pool_pre_ping=True)
+
+
+engine = _create_engine(DATABASE_URL)
 
 
 def init_db():
@@ -41,8 +63,7 @@ def init_db():
     metadata.create_all(engine)
 
 
-def upsert_client(
-    client_id,
+def _client_values(
     consent_accepted=None,
     consent_at=None,
     client_ip=None,
@@ -50,40 +71,163 @@ def upsert_client(
     user_agent=None,
     last_seen_at=None,
 ):
-    if engine is None:
-        return
-    now = datetime.utcnow()
     values = {
-        "client_id": client_id,
-        "updated_at": now,
+        "consent_accepted": consent_accepted,
+        "consent_at": consent_at,
+        "client_ip": client_ip,
+        "origin": origin,
+        "user_agent": user_agent,
+        "last_seen_at": last_seen_at,
     }
-    if consent_accepted is not None:
-        values["consent_accepted"] = consent_accepted
-    if consent_at is not None:
-        values["consent_at"] = consent_at
-    if client_ip is not None:
-        values["client_ip"] = client_ip
-    if origin is not None:
-        values["origin"] = origin
-    if user_agent is not None:
-        values["user_agent"] = user_agent
-    if last_seen_at is not None:
-        values["last_seen_at"] = last_seen_at
-
-    stmt = pg_insert(client_sessions).values(
-        client_id=client_id,
-        consent_accepted=values.get("consent_accepted", False),
-        consent_at=values.get("consent_at"),
-        client_ip=values.get("client_ip"),
-        origin=values.get("origin"),
-        user_agent=values.get("user_agent"),
-        created_at=now,
-        updated_at=now,
-        last_seen_at=values.get("last_seen_at"),
-    )
-    stmt = stmt.on_conflict_do_update(
-        index_elements=["client_id"],
-        set_=values,
-    )
+    return {key: value for key, value in values.items() if value is not None}
+
+
+def _insert(engine):
+    return sqlite_insert if engine.dialect.name == "sqlite" else pg_insert
+
+
+def write_client_rows(engine, rows):
+    # rows: {"client_id", "updated_at", <set columns>} dicts, at most one per client_id.
+    # Rows that set the same columns share one multi-row INSERT ... ON CONFLICT statement,
+    # so an update never overwrites a column it did not carry.
+    shapes = {}
+    for row in rows:
+        shape = tuple(column for column in UPDATABLE_COLUMNS if column in row)
+        shapes.setdefault(shape, []).append(row)
+
+    insert = _insert(engine)
+    columns = len(client_sessions.columns)
+    chunk = DB_FLUSH_BATCH_SIZE if engine.dialect.name != "sqlite" else max(1, SQLITE_MAX_VARIABLES // columns)
     with engine.begin() as conn:
-        conn.execute(stmt)
+        for shape, shape_rows in shapes.items():
+            for start in range(0, len(shape_rows), chunk):
+                values = [
+                    {
+                        "client_id": row["client_id"],
+                        "consent_accepted": row.get("consent_accepted", False),
+                        "consent_at": row.get("consent_at"),
+                        "client_ip": row.get("client_ip"),
+                        "origin": row.get("origin"),
+                        "user_agent": row.get("user_agent"),
+                        "created_at": row["updated_at"],
+                        "updated_at": row["updated_at"],
+                        "last_seen_at": row.get("last_seen_at"),
+                    }
+                    for row in shape_rows[start:start + chunk]
+                ]
+                stmt = insert(client_sessions).values(values)
+                set_ = {column: stmt.excluded[column] for column in shape + ("updated_at",)}
+                conn.execute(stmt.on_conflict_do_update(index_elements=["client_id"], set_=set_))
+
+
+def upsert_client(client_id, **fields):
+    # synchronous single-row write, the request handlers go through client_writer instead
+    if engine is None:
+        return
+    row = _client_values(**fields)
+    row["client_id"] = client_id
+    row["updated_at"] = datetime.utcnow()
+    write_client_rows(engine, [row])
+
+
+class ClientWriteBehind:
+    def __init__(
+        self,
+        engine,
+        flush_interval=DB_FLUSH_INTERVAL_SECONDS,
+        max_pending=DB_MAX_PENDING_CLIENTS,
+    ):
+        self.engine = engine
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.pending = {}
+        self.flush_lock = asyncio.Lock()
+        self.wakeup = asyncio.Event()
+        self.task = None
+        self.flushes = 0
+        self.rows_written = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.failures = 0
+
+    def submit(self, client_id, **fields):
+        if self.engine is None:
+            return
+        values = _client_values(**fields)
+        row = self.pending.get(client_id)
+        if row is not None:
+            row.update(values)
+            row["updated_at"] = datetime.utcnow()
+            self.coalesced += 1
+            return
+
+        if len(self.pending) >= self.max_pending:
+            self.wakeup.set()
+            # a last-seen refresh is worth less than the memory; consent changes are always kept
+            if set(values) <= {"last_seen_at"}:
+                self.dropped += 1
+                return
+        values["client_id"] = client_id
+        values["updated_at"] = datetime.utcnow()
+        self.pending[client_id] = values
+        if len(self.pending) >= self.max_pending:
+            self.wakeup.set()
+
+    async def start(self):
+        if self.engine is None or self.task is not None:
+            return
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+            await self.flush()
+
+    async def flush(self):
+        async with self.flush_lock:
+            if not self.pending or self.engine is None:
+                return
+            batch, self.pending = self.pending, {}
+            try:
+                # the blocking DB round trip stays off the event loop
+                await asyncio.to_thread(write_client_rows, self.engine, list(batch.values()))
+            except Exception:
+                self.failures += 1
+                logging.exception("client session flush failed, %d rows kept for retry", len(batch))
+                # newer updates that arrived during the flush win over the failed batch
+                for client_id, row in batch.items():
+                    newer = self.pending.get(client_id)
+                    if newer is not None:
+                        row.update(newer)
+                    self.pending[client_id] = row
+                return
+            self.flushes += 1
+            self.rows_written += len(batch)
+
+    def stats(self):
+        return {
+            "enabled": self.engine is not None,
+            "pending": len(self.pending),
+            "flushes": self.flushes,
+            "rowsWritten": self.rows_written,
+            "coalesced": self.coalesced,
+            "dropped": self.dropped,
+            "failures": self.failures,
+        }
+
+
+client_writer = ClientWriteBehind(engine)
@@ -1,8 +1,13 @@
+import argparse
+import queue
+import threading
 import cv2
 import mediapipe as mp
 import numpy as np
 import time
 
+from models.segmentation import BackgroundSegmenter
+
 class HandGestureDetector:
     def __init__(self, min_detection_conf=0.5, min_tracking_conf=0.5):
         self.mp_hands = mp.solutions.hands
@@ -143,68 +148,276 @@ class PoseDetector:
             self.mp_drawing.draw_landmarks(frame, landmarks, self.mp_pose.POSE_CONNECTIONS)
 
 
-class BackgroundSegmenter:
-    def __init__(self, background_image_path):
-        self.mp_selfie_segmentation = mp.solutions.selfie_segmentation
-        self.segmentation = self.mp_selfie_segmentation.SelfieSegmentation(model_selection=1)
-        self.background = cv2.imread(background_image_path)
-
-    def segment_background(self, frame):
-        h, w, _ = frame.shape
-        self.background = cv2.resize(self.background, (w, h))
+# frames waiting in front of each stage; small, so a slow stage drops camera frames instead of adding latency
+PIPELINE_QUEUE_SIZE = 2
+STOP = None
+
+
+class StageStats:
+    def __init__(self, name):
+        self.name = name
+        self.frames = 0
+        self.busy = 0.0
+        self.dropped = 0
+
+    def add(self, seconds):
+        self.frames += 1
+        self.busy += seconds
+
+    def report(self, wall_seconds):
+        # fps: frames per second of wall time; capacity: what the stage alone could do when never idle
+        return {
+            "stage": self.name,
+            "frames": self.frames,
+            "dropped": self.dropped,
+            "fps": self.frames / wall_seconds if wall_seconds > 0 else 0.0,
+            "capacity": self.frames / self.busy if self.busy > 0 else 0.0,
+            "ms": self.busy * 1000.0 / self.frames if self.frames else 0.0,
+        }
+
+
+def put_latest(q, item, stats):
+    # live camera: the oldest waiting frame makes room for the newest
+    while True:
+        try:
+            q.put_nowait(item)
+            return
+        except queue.Full:
+            try:
+                q.get_nowait()
+                stats.dropped += 1
+            except queue.Empty:
+                pass
+
+
+class Stage(threading.Thread):
+    # runs fn over (seq, payload) items in order on its own thread and passes (seq, result) on;
+    # MediaPipe graphs keep tracking state, so every model stays on exactly one stage thread
+    def __init__(self, name, fn, inbox, outboxes):
+        super().__init__(name=name, daemon=True)
+        self.fn = fn
+        self.inbox = inbox
+        self.outboxes = outboxes
+        self.stats = StageStats(name)
 
-        frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        result_seg = self.segmentation.process(frame_rgb)
-        mask = result_seg.segmentation_mask[:, :, np.newaxis]
-
-        return (frame * mask + self.background * (1 - mask)).astype(np.uint8)
+    def run(self):
+        while True:
+            item = self.inbox.get()
+            if item is STOP:
+                for outbox in self.outboxes:
+                    outbox.put(STOP)
+                return
+            seq, payload = item
+            started = time.perf_counter()
+            try:
+                result = self.fn(payload)
+            except Exception as e:
+                print(f"{self.name} failed on frame {seq}: {e}")
+                result = None
+            self.stats.add(time.perf_counter() - started)
+            for outbox in self.outboxes:
+                outbox.put((seq, result))
+
+
+class Reassembler:
+    # joins the per-stage results of one frame by its sequence number; stages finish frames in order,
+    # but at different times
+    def __init__(self, inboxes):
+        self.inboxes = inboxes
+        self.pending = [dict() for _ in inboxes]
+        self.last_seq = [-1] * len(inboxes)
+        self.stopped = [False] * len(inboxes)
+
+    def __iter__(self):
+        while True:
+            ready = set.intersection(*(set(pending) for pending in self.pending))
+            if ready:
+                seq = min(ready)
+                yield seq, [pending.pop(seq) for pending in self.pending]
+                continue
+            waiting = [i for i, stopped in enumerate(self.stopped) if not stopped]
+            if not waiting:
+                return
+            # read the stream that is furthest behind, the others may be blocked until it catches up
+            index = min(waiting, key=lambda i: self.last_seq[i])
+            item = self.inboxes[index].get()
+            if item is STOP:
+                self.stopped[index] = True
+                continue
+            seq, result = item
+            self.last_seq[index] = seq
+            self.pending[index][seq] = result
 
 
 class EdgeAiVision:
-    def __init__(self):
+    def __init__(self, source=0):
         self.hand_detector = HandGestureDetector()
         self.pose_detector = PoseDetector()
-        self.bg_segmenter = BackgroundSegmenter("pictures/background.jpg")
-        self.cap = cv2.VideoCapture(0)
+        # capture flips the frame already
+        self.bg_segmenter = BackgroundSegmenter(cv2.imread("pictures/background.jpg"), flip=False)
+        self.cap = cv2.VideoCapture(source)
+        # a file is read as fast as the pipeline takes it, every frame; a camera drops what the pipeline cannot take
+        self.live = isinstance(source, int)
+        self.stopping = threading.Event()
+
+    def segment(self, frame):
+        # the compositor reuses its output buffer, the copy travels on while the next frame is composited
+        frame_segmented = self.bg_segmenter.segment_background(frame).copy()
+        return frame_segmented, cv2.cvtColor(frame_segmented, cv2.COLOR_BGR2RGB)
+
+    def detect_hands(self, segmented):
+        return self.hand_detector.detect_hands(segmented[1])
+
+    def detect_pose(self, segmented):
+        return self.pose_detector.detect_pose(segmented[1])
+
+    def render(self, frame_segmented, hand_results, pose_results, fps):
+        handedness_list = hand_results.multi_handedness if hand_results and hand_results.multi_handedness else []
+        hand_landmarks = hand_results.multi_hand_landmarks if hand_results else None
+
+        self.hand_detector.draw_hands(frame_segmented, hand_landmarks, handedness_list)
+        if pose_results is not None:
+            self.pose_detector.draw_pose(frame_segmented, pose_results.pose_landmarks)
 
-    def run(self):
+        gesture = self.hand_detector.detect_gesture(hand_landmarks, handedness_list)
+
+        cv2.putText(frame_segmented, f'gesture: {gesture}', (50, 50), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
+        cv2.putText(frame_segmented, f'FPS: {fps:.2f}', (50, 90), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2)
+        return gesture
+
+    def capture(self, outbox, stats):
+        seq = 0
+        try:
+            while not self.stopping.is_set() and self.cap.isOpened():
+                started = time.perf_counter()
+                ret, frame = self.cap.read()
+                if not ret:
+                    break
+                frame = cv2.flip(frame, 1)
+                stats.add(time.perf_counter() - started)
+                if self.live:
+                    put_latest(outbox, (seq, frame), stats)
+                else:
+                    outbox.put((seq, frame))
+                seq += 1
+        finally:
+            # the stages pass STOP on, so every thread of the pipeline ends after the frames in flight
+            outbox.put(STOP)
+
+    def run(self, headless=False):
+        # capture -> segmentation -> hand and pose side by side -> reassembly and drawing on this thread
+        to_segment = queue.Queue(PIPELINE_QUEUE_SIZE)
+        to_hands = queue.Queue(PIPELINE_QUEUE_SIZE)
+        to_pose = queue.Queue(PIPELINE_QUEUE_SIZE)
+        segmented = queue.Queue(PIPELINE_QUEUE_SIZE * 2)
+        hands_done = queue.Queue(PIPELINE_QUEUE_SIZE * 2)
+        pose_done = queue.Queue(PIPELINE_QUEUE_SIZE * 2)
+
+        capture_stats = StageStats("capture")
+        stages = [
+            Stage("segmentation", self.segment, to_segment, [to_hands, to_pose, segmented]),
+            Stage("hands", self.detect_hands, to_hands, [hands_done]),
+            Stage("pose", self.detect_pose, to_pose, [pose_done]),
+        ]
+        render_stats = StageStats("render")
+        capture = threading.Thread(target=self.capture, args=(to_segment, capture_stats), name="capture", daemon=True)
+
+        started = time.perf_counter()
+        for stage in stages:
+            stage.start()
+        capture.start()
+
+        self.stopping.clear()
+        results = iter(Reassembler([segmented, hands_done, pose_done]))
+        prev_frame_time = 0
+        for _, (frame, hand_results, pose_results) in results:
+            if frame is None:
+                continue
+            render_started = time.perf_counter()
+            new_frame_time = time.time()
+            fps = 1 / (new_frame_time - prev_frame_time + 1e-6)
+            prev_frame_time = new_frame_time
+
+            frame_segmented = frame[0]
+            self.render(frame_segmented, hand_results, pose_results, fps)
+            render_stats.add(time.perf_counter() - render_started)
+            if headless:
+                continue
+
+            cv2.imshow('gesture detection', frame_segmented)
+            if cv2.waitKey(1) & 0xFF == 27:
+                break
+
+        wall = time.perf_counter() - started
+        # ESC: capture stops at its next read, the frames still queued are drained until STOP has passed
+        # every stage, and the device is released only once no thread can be reading from it
+        self.stopping.set()
+        for _ in results:
+            pass
+        capture.join()
+        for stage in stages:
+            stage.join()
+        self.cap.release()
+        if not headless:
+            cv2.destroyAllWindows()
+        return [capture_stats.report(wall)] + [stage.stats.report(wall) for stage in stages] + [render_stats.report(wall)]
+
+    def run_sequential(self, headless=False):
+        # the single-threaded loop, kept as the baseline the pipeline is measured against
+        stats = {name: StageStats(name) for name in ("capture", "segmentation", "hands", "pose", "render")}
+        started = time.perf_counter()
         prev_frame_time = 0
         while self.cap.isOpened():
+            t0 = time.perf_counter()
             ret, frame = self.cap.read()
             if not ret:
                 break
-
             frame = cv2.flip(frame, 1)
-
-            frame_segmented = self.bg_segmenter.segment_background(frame)
-
-            frame_rgb = cv2.cvtColor(frame_segmented, cv2.COLOR_BGR2RGB)
-
-            hand_results = self.hand_detector.detect_hands(frame_rgb)
-            pose_results = self.pose_detector.detect_pose(frame_rgb)
-
-            handedness_list = hand_results.multi_handedness if hand_results.multi_handedness else []
-
-            self.hand_detector.draw_hands(frame_segmented, hand_results.multi_hand_landmarks, handedness_list)
-            self.pose_detector.draw_pose(frame_segmented, pose_results.pose_landmarks)
-
-            gesture = self.hand_detector.detect_gesture(hand_results.multi_hand_landmarks, handedness_list)
+            t1 = time.perf_counter()
+            segmented = self.segment(frame)
+            t2 = time.perf_counter()
+            hand_results = self.detect_hands(segmented)
+            t3 = time.perf_counter()
+            pose_results = self.detect_pose(segmented)
+            t4 = time.perf_counter()
 
             new_frame_time = time.time()
             fps = 1 / (new_frame_time - prev_frame_time + 1e-6)
             prev_frame_time = new_frame_time
+            self.render(segmented[0], hand_results, pose_results, fps)
+            t5 = time.perf_counter()
 
-            cv2.putText(frame_segmented, f'gesture: {gesture}', (50, 50), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
-            cv2.putText(frame_segmented, f'FPS: {fps:.2f}', (50, 90), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2)
-
-            cv2.imshow('gesture detection', frame_segmented)
+            for name, seconds in zip(stats, (t1 - t0, t2 - t1, t3 - t2, t4 - t3, t5 - t4)):
+                stats[name].add(seconds)
+            if headless:
+                continue
 
+            cv2.imshow('gesture detection', segmented[0])
             if cv2.waitKey(1) & 0xFF == 27:
                 break
 
+        wall = time.perf_counter() - started
         self.cap.release()
-        cv2.destroyAllWindows()
+        if not headless:
+            cv2.destroyAllWindows()
+        return [stage.report(wall) for stage in stats.values()]
+
+
+def print_report(reports):
+    for report in reports:
+        print(
+            f"{report['stage']:14s} {report['frames']:6d} frames {report['dropped']:5d} dropped "
+            f"{report['fps']:8.2f} fps {report['capacity']:8.2f} fps capacity {report['ms']:8.2f} ms/frame"
+        )
+
 
 if __name__ == "__main__":
-    app = EdgeAiVision()
-    app.run()
+    parser = argparse.ArgumentParser(description="Local gesture, pose and virtual background loop.")
+    parser.add_argument("--video", help="read frames from a video file instead of the webcam")
+    parser.add_argument("--headless", action="store_true", help="no window; print per-stage FPS at the end")
+    parser.add_argument("--sequential", action="store_true", help="run every stage on one thread, as a baseline")
+    args = parser.parse_args()
+
+    app = EdgeAiVision(args.video if args.video else 0)
+    reports = app.run_sequential(args.headless) if args.sequential else app.run(args.headless)
+    print_report(reports)
@@ -1,17 +1,55 @@
+import time
+
+imports_started = time.perf_counter()
+
+import asyncio
 from fastapi import FastAPI
-from api.routes import router
+from api.routes import router, deliver_event
+from api.executor import inference_executor
+from api.event_bus import event_bus
+from api.startup import startup_state, warm_up
 import uvicorn
 from fastapi.middleware.cors import CORSMiddleware
-from db import init_db
+from db import init_db, client_writer
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse
 import os
 
+startup_state.record("imports", imports_started)
+
 app = FastAPI()
 
 app.include_router(router)
 
-init_db()
+with startup_state.phase("init_db"):
+    init_db()
+
+@app.on_event("startup")
+async def start_inference():
+    with startup_state.phase("executor"):
+        inference_executor.start()
+    # warm-up runs in the background, /healthz answers meanwhile and /readyz reports 503 until it is done
+    app.state.warm_up = asyncio.create_task(warm_up(inference_executor))
+
+@app.on_event("shutdown")
+def stop_inference():
+    inference_executor.shutdown()
+
+@app.on_event("startup")
+async def start_event_bus():
+    await event_bus.start(deliver_event)
+
+@app.on_event("shutdown")
+async def stop_event_bus():
+    await event_bus.stop()
+
+@app.on_event("startup")
+async def start_client_writer():
+    await client_writer.start()
+
+@app.on_event("shutdown")
+async def flush_client_writer():
+    await client_writer.stop()
 
 app.add_middleware(
     CORSMiddleware,
@@ -24,7 +62,5 @@ app.add_middleware(
 # build_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "client_frontend", "build")
 # app.mount("/", StaticFiles(directory=build_dir, html=True), name="static")
 
-app.include_router(router)
-
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -1,5 +1,9 @@
+import os
+import threading
+
 import cv2
 import mediapipe as mp
+import numpy as np
 
 from mediapipe.tasks.python.vision import HandLandmarker
 from mediapipe.tasks.python.vision import HandLandmarkerOptions
@@ -12,109 +16,269 @@ WRIST = 0
 INDEX_FINGER_MCP = 5
 INDEX_FINGER_TIP = 8
 
+LEFT = 0
+RIGHT = 1
+HANDEDNESS_LABELS = ("Left", "Right")
+MAX_HANDS = 2
 
-class HandGestureDetector:
-    def __init__(self, min_detection_conf=0.5, min_tracking_conf=0.5):
-        options = HandLandmarkerOptions(
-            base_options=BaseOptions(model_asset_path="/app/hand_landmarker.task"),
-            running_mode=RunningMode.IMAGE,
-            num_hands=2,
-            min_hand_detection_confidence=min_detection_conf,
-            min_tracking_confidence=min_tracking_conf,
+SWIPE_MIN_DISPLACEMENT = 0.08
+SWIPE_MIN_VELOCITY = 0.30
+
+# frames of timestamped landmarks each detector keeps for the swipe rule
+LANDMARK_HISTORY_FRAMES = 8
+
+HAND_MODEL_PATH = os.getenv("HAND_MODEL_PATH", "/app/hand_landmarker.task")
+WARMUP_FRAME_SHAPE = (480, 640, 3)
+
+_model_buffers = {}
+_model_lock = threading.Lock()
+
+
+def load_model_buffer(path=HAND_MODEL_PATH):
+    # read once per process and shared by every landmarker in it; each uvicorn worker holds its own copy
+    with _model_lock:
+        buffer = _model_buffers.get(path)
+        if buffer is None:
+            with open(path, "rb") as f:
+                buffer = f.read()
+            _model_buffers[path] = buffer
+        return buffer
+
+
+class HandLandmarks:
+    # one detection result as contiguous arrays:
+    # points (hands, 21, 3) float32, handedness (hands,) int8 LEFT/RIGHT/-1, scores (hands,) float32
+    __slots__ = ("points", "handedness", "scores")
+
+    def __init__(self, points, handedness, scores):
+        self.points = points
+        self.handedness = handedness
+        self.scores = scores
+
+    @classmethod
+    def empty(cls):
+        return cls(np.zeros((0, 21, 3), np.float32), np.zeros(0, np.int8), np.zeros(0, np.float32))
+
+    @classmethod
+    def from_result(cls, result):
+        if not result.hand_landmarks or not result.handedness:
+            return cls.empty()
+        points = np.array(
+            [[(lm.x, lm.y, lm.z) for lm in hand_landmarks] for hand_landmarks in result.hand_landmarks],
+            np.float32,
+        )
+        categories = [handedness[0] for handedness in result.handedness]
+        handedness = np.array(
+            [HANDEDNESS_LABELS.index(c.category_name) if c.category_name in HANDEDNESS_LABELS else -1
+             for c in categories],
+            np.int8,
         )
+        scores = np.array([float(c.score or 0.0) for c in categories], np.float32)
+        return cls(points, handedness, scores)
+
+    def __len__(self):
+        return len(self.points)
+
+    @property
+    def labels(self):
+        return [HANDEDNESS_LABELS[i] if i >= 0 else "Unknown" for i in self.handedness]
+
+    def hand_boxes(self, image_shape):
+        h, w = image_shape[:2]
+        xy = self.points[:, :, :2]
+        boxes = np.concatenate([xy.min(axis=1), xy.max(axis=1)], axis=1)
+        return (boxes * np.array([w, h, w, h], np.float32)).astype(np.int32)
+
+    def index_tip_positions(self, image_shape):
+        h, w = image_shape[:2]
+        return (self.points[:, INDEX_FINGER_TIP, :2] * np.array([w, h], np.float32)).astype(np.int32)
+
+
+def pointing_mask(points):
+    # works on (hands, 21, 3) and on stacked (clients, hands, 21, 3) arrays
+    return points[..., INDEX_FINGER_TIP, 1] < points[..., INDEX_FINGER_MCP, 1]
+
+
+def stack_landmarks(landmarks_list, max_hands=MAX_HANDS):
+    points = np.zeros((len(landmarks_list), max_hands, 21, 3), np.float32)
+    valid = np.zeros((len(landmarks_list), max_hands), bool)
+    for i, landmarks in enumerate(landmarks_list):
+        count = min(len(landmarks), max_hands)
+        points[i, :count] = landmarks.points[:count]
+        valid[i, :count] = True
+    return points, valid
+
 
-        self.hands = HandLandmarker.create_from_options(options)
+def detect_gestures(detectors, landmarks_list, times=None):
+    # the stateless rules run over the whole batch at once, swipe state stays per detector
+    points, valid = stack_landmarks(landmarks_list)
+    pointing = pointing_mask(points) & valid
+    times = times if times is not None else [None] * len(landmarks_list)
+    return [
+        detector.detect_gesture(landmarks, pointing=pointing[i, :len(landmarks)], now=now)
+        for i, (detector, landmarks, now) in enumerate(zip(detectors, landmarks_list, times))
+    ]
+
+
+class LandmarkHistory:
+    # ring of timestamped landmarks; the swipe rule looks its predecessor up by timestamp,
+    # so a frame gets the same answer however late or in whatever batch it is processed
+    def __init__(self, size=LANDMARK_HISTORY_FRAMES, max_hands=MAX_HANDS):
+        self.times = np.full(size, -np.inf)
+        self.points = np.zeros((size, max_hands, 21, 3), np.float32)
+        self.handedness = np.full((size, max_hands), -1, np.int8)
+        self.head = 0
+
+    def push(self, timestamp, landmarks):
+        i = self.head
+        count = min(len(landmarks), self.points.shape[1])
+        self.times[i] = timestamp
+        self.points[i, :count] = landmarks.points[:count]
+        self.handedness[i] = -1
+        self.handedness[i, :count] = landmarks.handedness[:count]
+        self.head = (i + 1) % len(self.times)
+
+    def last_left_tip(self, before):
+        # index tip x of the last left hand in the newest frame at or before `before` that had one
+        candidates = (self.handedness == LEFT).any(axis=1) & (self.times <= before)
+        if not candidates.any():
+            return None, None
+        indexes = np.flatnonzero(candidates)
+        i = indexes[np.argmax(self.times[indexes])]
+        hand = np.flatnonzero(self.handedness[i] == LEFT)[-1]
+        return float(self.points[i, hand, INDEX_FINGER_TIP, 0]), float(self.times[i])
+
+
+class HandGestureDetector:
+    def __init__(self, min_detection_conf=0.5, min_tracking_conf=0.5, running_mode=RunningMode.IMAGE,
+                 landmarker_factory=None):
+        self.min_detection_conf = min_detection_conf
+        self.min_tracking_conf = min_tracking_conf
+        self.running_mode = running_mode
+        # the landmarker is built on first use, clients that send landmarks never need one;
+        # landmarker_factory(detector) can hand over a prebuilt, warmed-up one instead
+        self.landmarker_factory = landmarker_factory
+        self._hands = None
 
         # ❌ TÖRÖLVE: mp.solutions
         # self.mp_drawing = mp.solutions.drawing_utils
         # self.mp_hands = mp.solutions.hands
 
-        self.prev_left_x = None
-        self.prev_left_t = None
+        self.history = LandmarkHistory()
+
+    def build_options(self):
+        return HandLandmarkerOptions(
+            base_options=BaseOptions(model_asset_buffer=load_model_buffer()),
+            running_mode=self.running_mode,
+            num_hands=MAX_HANDS,
+            min_hand_detection_confidence=self.min_detection_conf,
+            min_tracking_confidence=self.min_tracking_conf,
+        )
+
+    @property
+    def hands(self):
+        if self._hands is None:
+            if self.landmarker_factory is not None:
+                self._hands = self.landmarker_factory(self)
+            else:
+                self._hands = HandLandmarker.create_from_options(self.build_options())
+        return self._hands
+
+    def warm_up(self, frames=1, shape=WARMUP_FRAME_SHAPE):
+        # the first inferences initialize the graph and the delegate, pay for that before real frames arrive
+        frame = np.zeros(shape, np.uint8)
+        for i in range(frames):
+            self.detect_hands(frame, i)
 
-    def detect_hands(self, frame_rgb):
+    def detect_hands(self, frame_rgb, timestamp_ms=None):
         mp_image = mp.Image(image_format=mp.ImageFormat.SRGB, data=frame_rgb)
+        if self.running_mode == RunningMode.VIDEO:
+            # VIDEO mode tracks the hand from the previous frame and skips palm detection
+            return self.hands.detect_for_video(mp_image, timestamp_ms)
         return self.hands.detect(mp_image)
 
-    def draw_hands(self, frame, result):
-        if not result.hand_landmarks:
-            return
+    def detect_landmarks(self, frame_rgb, timestamp_ms=None):
+        return HandLandmarks.from_result(self.detect_hands(frame_rgb, timestamp_ms))
 
-        h, w, _ = frame.shape
+    def close(self):
+        if self._hands is not None:
+            self._hands.close()
+            self._hands = None
 
-        for hand_landmarks, handedness in zip(result.hand_landmarks, result.handedness):
-            for lm in hand_landmarks:
-                cx, cy = int(lm.x * w), int(lm.y * h)
-                cv2.circle(frame, (cx, cy), 3, (0, 255, 0), -1)
+    def draw_hands(self, frame, landmarks):
+        if not isinstance(landmarks, HandLandmarks):
+            landmarks = HandLandmarks.from_result(landmarks)
+        if not len(landmarks):
+            return
 
-            hand_label = handedness[0].category_name
+        h, w = frame.shape[:2]
+        pixels = (landmarks.points[:, :, :2] * np.array([w, h], np.float32)).astype(np.int32)
+        boxes = landmarks.hand_boxes(frame.shape)
 
-            x_min = int(min([lm.x for lm in hand_landmarks]) * w)
-            y_min = int(min([lm.y for lm in hand_landmarks]) * h)
-            x_max = int(max([lm.x for lm in hand_landmarks]) * w)
-            y_max = int(max([lm.y for lm in hand_landmarks]) * h)
+        for hand_pixels, (x_min, y_min, x_max, y_max), hand_label in zip(pixels, boxes, landmarks.labels):
+            for cx, cy in hand_pixels:
+                cv2.circle(frame, (int(cx), int(cy)), 3, (0, 255, 0), -1)
 
-            cv2.rectangle(frame, (x_min, y_min), (x_max, y_max), (0, 0, 255), 2)
-            cv2.putText(frame, hand_label, (x_min, y_min - 10),
+            cv2.rectangle(frame, (int(x_min), int(y_min)), (int(x_max), int(y_max)), (0, 0, 255), 2)
+            cv2.putText(frame, hand_label, (int(x_min), int(y_min) - 10),
                         cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 255), 2)
 
-    def get_index_tip_position(self, result, image_shape):
-        if not result.hand_landmarks:
+    def get_index_tip_position(self, landmarks, image_shape):
+        if not isinstance(landmarks, HandLandmarks):
+            landmarks = HandLandmarks.from_result(landmarks)
+        if not len(landmarks):
             return None
 
-        landmark = result.hand_landmarks[0][INDEX_FINGER_TIP]
-        h, w, _ = image_shape
-        return int(landmark.x * w), int(landmark.y * h)
+        cx, cy = landmarks.index_tip_positions(image_shape)[0]
+        return int(cx), int(cy)
 
     def get_landmark_px(self, landmark, image_shape):
         h, w, _ = image_shape
         return landmark.x * w, landmark.y * h
 
-    def detect_gesture(self, result, frame):
-        if not result.hand_landmarks or not result.handedness:
+    def detect_gesture(self, landmarks, frame=None, pointing=None, now=None):
+        if not isinstance(landmarks, HandLandmarks):
+            landmarks = HandLandmarks.from_result(landmarks)
+        if not len(landmarks):
             return "None", 0.0
 
-        hand_gesture = "None"
-        confidence = 0.0
-        now_tick = cv2.getTickCount() / cv2.getTickFrequency()
-
-        for hand_landmarks, handedness in zip(result.hand_landmarks, result.handedness):
-            hand_label = handedness[0].category_name
-            handedness_score = float(handedness[0].score or 0.0)
-            landmarks = hand_landmarks
-
-            wrist = landmarks[WRIST]
-            index_tip = landmarks[INDEX_FINGER_TIP]
-            index_mcp = landmarks[INDEX_FINGER_MCP]
-
-            def is_pointing():
-                return index_tip.y < index_mcp.y
-
-            if is_pointing():
-                hand_gesture = "Pointing"
-                confidence = max(confidence, handedness_score)
-
-            if hand_label == "Left":
-                delta_x = 0.0
-                dt = 0.0
-                velocity = 0.0
-                if self.prev_left_x is not None and self.prev_left_t is not None:
-                    delta_x = index_tip.x - self.prev_left_x
-                    dt = now_tick - self.prev_left_t
-                    if dt > 0:
-                        velocity = delta_x / dt
-
-                self.prev_left_x = index_tip.x
-                self.prev_left_t = now_tick
-
-                min_displacement = 0.08
-                min_velocity = 0.30
-                if abs(delta_x) > min_displacement and abs(velocity) > min_velocity:
-                    if delta_x > 0:
-                        hand_gesture = "Swipe Right"
-                    else:
-                        hand_gesture = "Swipe Left"
-                    gesture_strength = min(1.0, max(abs(delta_x) / 0.2, abs(velocity) / 0.8))
-                    confidence = max(confidence, handedness_score * gesture_strength)
+        now_tick = cv2.getTickCount() / cv2.getTickFrequency() if now is None else now
+        scores = landmarks.scores.astype(np.float64)
+        if pointing is None:
+            pointing = pointing_mask(landmarks.points)
+
+        hand_gestures = ["Pointing" if is_pointing else "None" for is_pointing in pointing]
+        confidence = float(scores[pointing].max()) if pointing.any() else 0.0
 
+        left = np.flatnonzero(landmarks.handedness == LEFT)
+        if len(left):
+            # each left hand is compared with the one before it, the first with the last frame
+            tip_x = landmarks.points[left, INDEX_FINGER_TIP, 0].astype(np.float64)
+            prev_x = np.empty_like(tip_x)
+            prev_x[1:] = tip_x[:-1]
+            dt = np.zeros_like(tip_x)
+            last_x, last_t = self.history.last_left_tip(now_tick)
+            if last_x is not None:
+                prev_x[0] = last_x
+                dt[0] = now_tick - last_t
+            else:
+                prev_x[0] = tip_x[0]
+
+            delta_x = tip_x - prev_x
+            velocity = np.divide(delta_x, dt, out=np.zeros_like(delta_x), where=dt > 0)
+            swipe = (np.abs(delta_x) > SWIPE_MIN_DISPLACEMENT) & (np.abs(velocity) > SWIPE_MIN_VELOCITY)
+
+            if swipe.any():
+                strength = np.minimum(1.0, np.maximum(np.abs(delta_x) / 0.2, np.abs(velocity) / 0.8))
+                confidence = max(confidence, float((scores[left] * strength)[swipe].max()))
+                for hand, dx in zip(left[swipe], delta_x[swipe]):
+                    hand_gestures[hand] = "Swipe Right" if dx > 0 else "Swipe Left"
+
+        self.history.push(now_tick, landmarks)
+
+        # as before, the last hand that shows a gesture decides the label
+        hand_gesture = "None"
+        for gesture in hand_gestures:
+            if gesture != "None":
+                hand_gesture = gesture
         return hand_gesture, confidence
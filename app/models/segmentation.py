@@ -1,22 +1,105 @@
+import os
+import threading
+from collections import OrderedDict
+
 import cv2
 import mediapipe as mp
 import numpy as np
 
+# width the selfie mask is computed at, upsampled to the frame afterwards; 0 keeps the frame size
+SEGMENTATION_MASK_WIDTH = int(os.getenv("SEGMENTATION_MASK_WIDTH", "0"))
+# resized backgrounds kept per output resolution
+BACKGROUND_CACHE_SIZES = 4
+
+
+class BackgroundCompositor:
+    # blends a frame over a fixed background with an 8-bit alpha mask, entirely in uint8
+    # and into reused buffers; the returned array is overwritten by the next call
+    def __init__(self, background_image, cache_sizes=BACKGROUND_CACHE_SIZES):
+        self.cache_sizes = max(1, cache_sizes)
+        # the background may be swapped from another thread than the one compositing
+        self.lock = threading.Lock()
+        self.buffers = {}
+        self.set_background(background_image)
+
+    def set_background(self, background_image):
+        if not isinstance(background_image, np.ndarray):
+            raise ValueError("The background must be a valid image array (NumPy array).")
+        if background_image.ndim == 2:
+            background_image = cv2.cvtColor(background_image, cv2.COLOR_GRAY2BGR)
+        elif background_image.shape[2] == 4:
+            background_image = cv2.cvtColor(background_image, cv2.COLOR_BGRA2BGR)
+        with self.lock:
+            self.source = background_image
+            self.backgrounds = OrderedDict()
+
+    def buffer(self, name, shape):
+        array = self.buffers.get(name)
+        if array is None or array.shape != shape:
+            array = np.empty(shape, np.uint8)
+            self.buffers[name] = array
+        return array
+
+    def background_for(self, width, height):
+        # always resized from the original, so switching sizes back and forth does not lose quality
+        key = (width, height)
+        with self.lock:
+            background = self.backgrounds.get(key)
+            if background is None:
+                src_h, src_w = self.source.shape[:2]
+                shrinking = width * height < src_w * src_h
+                interpolation = cv2.INTER_AREA if shrinking else cv2.INTER_LINEAR
+                background = cv2.resize(self.source, (width, height), interpolation=interpolation)
+                self.backgrounds[key] = background
+                while len(self.backgrounds) > self.cache_sizes:
+                    self.backgrounds.popitem(last=False)
+            else:
+                self.backgrounds.move_to_end(key)
+            return background
+
+    def alpha(self, mask, width, height):
+        # float [0, 1] mask of any size -> uint8 alpha at (width, height)
+        alpha = cv2.convertScaleAbs(mask, dst=self.buffer("mask_alpha", mask.shape[:2]), alpha=255)
+        if alpha.shape[:2] == (height, width):
+            return alpha
+        return cv2.resize(alpha, (width, height), dst=self.buffer("alpha", (height, width)), interpolation=cv2.INTER_LINEAR)
+
+    def composite(self, frame, alpha):
+        # out = (frame * a + background * (255 - a)) / 255, alpha is a uint8 (h, w) mask
+        h, w = frame.shape[:2]
+        background = self.background_for(w, h)
+        alpha3 = cv2.cvtColor(alpha, cv2.COLOR_GRAY2BGR, dst=self.buffer("alpha3", (h, w, 3)))
+        inverse = cv2.bitwise_not(alpha3, dst=self.buffer("inverse", (h, w, 3)))
+        out = cv2.multiply(frame, alpha3, dst=self.buffer("out", (h, w, 3)), scale=1 / 255)
+        back = cv2.multiply(background, inverse, dst=self.buffer("back", (h, w, 3)), scale=1 / 255)
+        return cv2.add(out, back, dst=out)
+
+
 class BackgroundSegmenter:
-    def __init__(self, background_image):
+    def __init__(self, background_image, mask_width=SEGMENTATION_MASK_WIDTH, flip=True):
         self.mp_selfie_segmentation = mp.solutions.selfie_segmentation
         self.segmentation = self.mp_selfie_segmentation.SelfieSegmentation(model_selection=1)
-        
-        if isinstance(background_image, np.ndarray):
-            self.background = background_image
-        else:
-            raise ValueError("The background must be a valid image array (NumPy array).")
+        self.compositor = BackgroundCompositor(background_image)
+        self.mask_width = mask_width
+        self.flip = flip
+
+    def set_background(self, background_image):
+        # keeps the loaded model, only the compositor's background changes
+        self.compositor.set_background(background_image)
+
+    def person_alpha(self, frame):
+        # uint8 person mask at the frame size; with mask_width set the model sees a downscaled frame
+        h, w = frame.shape[:2]
+        buffer = self.compositor.buffer
+        small = frame
+        if self.mask_width and w > self.mask_width:
+            size = (self.mask_width, max(1, round(h * self.mask_width / w)))
+            small = cv2.resize(frame, size, dst=buffer("mask_input", (size[1], size[0], 3)), interpolation=cv2.INTER_AREA)
+        frame_rgb = cv2.cvtColor(small, cv2.COLOR_BGR2RGB, dst=buffer("mask_rgb", small.shape))
+        mask = self.segmentation.process(frame_rgb).segmentation_mask
+        return self.compositor.alpha(mask, w, h)
 
     def segment_background(self, frame):
-        h, w, _ = frame.shape
-        frame = cv2.flip(frame, 1)
-        self.background = cv2.resize(self.background, (w, h))  
-        frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        result_seg = self.segmentation.process(frame_rgb)
-        mask = result_seg.segmentation_mask[:, :, np.newaxis]
-        return (frame * mask + self.background * (1 - mask)).astype(np.uint8)
+        if self.flip:
+            frame = cv2.flip(frame, 1, dst=self.compositor.buffer("flip", frame.shape))
+        return self.compositor.composite(frame, self.person_alpha(frame))
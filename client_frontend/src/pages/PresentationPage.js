@@ -11,6 +11,7 @@ import { useTranslation } from 'react-i18next';
 import CursorFollower from "../components/CursorFollower";
 import { Dialog, DialogTitle, DialogContent, DialogActions, Button as MuiButton, Typography } from "@mui/material";
 import { useNavigate } from "react-router-dom";
+import { buildFrameMessage, helloMessage } from "../utils/frameProtocol";
 
 import * as pdfjsLib from "pdfjs-dist/legacy/build/pdf";
 import { GlobalWorkerOptions } from "pdfjs-dist/legacy/build/pdf";
@@ -51,6 +52,14 @@ const PresentationPage = () => {
     const cameraRef = useRef(null);
     const segmentationRef = useRef(null);
     const wsRef = useRef(null);
+    const creditsRef = useRef(0);
+    const seqRef = useRef(0);
+    // capture hints pushed by the server: lower rate and resolution while no hand is in view
+    const captureFpsRef = useRef(10);
+    const captureMaxWidthRef = useRef(0);
+    // JPEG quality (0-100) from the server's capture profile, browser default until the welcome
+    const jpegQualityRef = useRef(null);
+    const lastCaptureRef = useRef(0);
     const segmentationActiveRef = useRef(false);
     const cameraStartedRef = useRef(false);
     const mediaStreamRef = useRef(null);
@@ -391,37 +400,50 @@ const PresentationPage = () => {
         }
     };
 
-    let frameCounter = 0;
-
     const startFrameStreaming = () => {
-        frameInterval.current = setInterval(async () => {
-            if (webcamRef.current && clientId) {
-                const video = webcamRef.current.video;
-                const canvas = document.createElement("canvas");
-                const ctx = canvas.getContext("2d");
-
-                canvas.width = video.videoWidth;
-                canvas.height = video.videoHeight;
-                ctx.drawImage(video, 0, 0, canvas.width, canvas.height);
-
-                canvas.toBlob(async (blob) => {
-                    if (blob) {
-                        const formData = new FormData();
-                        formData.append("frame", blob, "frame.jpg");
-                        const frameId = ++frameCounter;
-                        
-
-                        try {
-                            await fetch(`${SERVER_URL}/process_frame?frameId=${frameId}&clientId=${encodeURIComponent(clientId)}`, {
-                                method: "POST",
-                                body: formData,
-                            });
-                        } catch (error) {
-                            console.error("Error sending frame", error);
-                        }
-                    }
-                }, "image/jpeg");
+        frameInterval.current = setInterval(() => {
+            const ws = wsRef.current;
+            if (!webcamRef.current || !clientId || !ws || ws.readyState !== WebSocket.OPEN) {
+                return;
+            }
+            const now = Date.now();
+            if (now - lastCaptureRef.current < 1000 / captureFpsRef.current) {
+                return;
+            }
+            // one credit per frame in flight, the server hands it back with the frame's ack
+            if (creditsRef.current <= 0) {
+                return;
             }
+            creditsRef.current -= 1;
+            lastCaptureRef.current = now;
+
+            const video = webcamRef.current.video;
+            const canvas = document.createElement("canvas");
+            const ctx = canvas.getContext("2d");
+
+            // the limit applies to the longer side, so portrait phone cameras are not sent taller than wide frames
+            const maxWidth = captureMaxWidthRef.current;
+            const longSide = Math.max(video.videoWidth, video.videoHeight);
+            const scale = maxWidth && longSide > maxWidth ? maxWidth / longSide : 1;
+            canvas.width = Math.round(video.videoWidth * scale);
+            canvas.height = Math.round(video.videoHeight * scale);
+            ctx.drawImage(video, 0, 0, canvas.width, canvas.height);
+            const captureTs = now;
+
+            canvas.toBlob(async (blob) => {
+                try {
+                    if (!blob || wsRef.current !== ws || ws.readyState !== WebSocket.OPEN) {
+                        creditsRef.current += 1;
+                        return;
+                    }
+                    const buffer = await blob.arrayBuffer();
+                    seqRef.current += 1;
+                    ws.send(buildFrameMessage(seqRef.current, buffer, captureTs));
+                } catch (error) {
+                    creditsRef.current += 1;
+                    console.error("Error sending frame", error);
+                }
+            }, "image/jpeg", jpegQualityRef.current ? jpegQualityRef.current / 100 : undefined);
         }, 100);
     };
 
@@ -437,10 +459,33 @@ const PresentationPage = () => {
         }
         const ws = new WebSocket(`${WS_URL}?clientId=${encodeURIComponent(clientId)}`);
         wsRef.current = ws;
+        creditsRef.current = 0;
+
+        ws.onopen = () => {
+            ws.send(helloMessage());
+        };
 
         ws.onmessage = (event) => {
             try {
                 const data = JSON.parse(event.data);
+                if (data?.type === "welcome") {
+                    creditsRef.current = data.credits;
+                    if (data.profile) {
+                        captureFpsRef.current = data.profile.fps > 0 ? data.profile.fps : 10;
+                        captureMaxWidthRef.current = data.profile.maxWidth || 0;
+                        jpegQualityRef.current = data.profile.jpegQuality || null;
+                    }
+                    return;
+                }
+                if (data?.type === "ack") {
+                    creditsRef.current += data.credit || 0;
+                    return;
+                }
+                if (data?.type === "capture") {
+                    captureFpsRef.current = data.fps > 0 ? data.fps : 10;
+                    captureMaxWidthRef.current = data.maxWidth || 0;
+                    return;
+                }
                 if (!data?.gesture) {
                     return;
                 }
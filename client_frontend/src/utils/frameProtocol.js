@@ -0,0 +1,24 @@
+// Binary frame message for /ws, see app/api/frame_protocol.py:
+// 20 byte little endian header (magic "GVFR", version u8, flags u8, reserved u16, seq u32,
+// capture timestamp f64 ms) followed by the JPEG bytes.
+export const FRAME_PROTOCOL_VERSION = 1;
+export const FRAME_HEADER_BYTES = 20;
+export const REQUESTED_CREDITS = 2;
+
+const MAGIC = [0x47, 0x56, 0x46, 0x52];
+
+export const helloMessage = () =>
+    JSON.stringify({ type: "hello", protocol: FRAME_PROTOCOL_VERSION, credits: REQUESTED_CREDITS });
+
+export const buildFrameMessage = (seq, jpegBuffer, captureTs) => {
+    const message = new Uint8Array(FRAME_HEADER_BYTES + jpegBuffer.byteLength);
+    const view = new DataView(message.buffer);
+    MAGIC.forEach((byte, i) => view.setUint8(i, byte));
+    view.setUint8(4, FRAME_PROTOCOL_VERSION);
+    view.setUint8(5, 0);
+    view.setUint16(6, 0, true);
+    view.setUint32(8, seq >>> 0, true);
+    view.setFloat64(12, captureTs, true);
+    message.set(new Uint8Array(jpegBuffer), FRAME_HEADER_BYTES);
+    return message.buffer;
+};
@@ -0,0 +1,38 @@
+# Runs MediaPipe once over recorded JPEG sequences and stores the landmarks as landmark streams,
+# so classifier experiments can be replayed with landmark_replay.py without re-running the model.
+#
+#   python meresek/landmark_record.py recordings/ streams/ --fps 10
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+from api.landmark_stream import LandmarkRecorder
+from api.process import FrameBuffers, decode_frame_rgb, detect_landmarks
+from api.sessions import DetectorSession
+from replay_benchmark import load_sessions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert recorded JPEG sequences into landmark streams.")
+    parser.add_argument("frames_dir")
+    parser.add_argument("output_dir")
+    parser.add_argument("--fps", type=float, default=10.0, help="capture rate the frames were recorded at")
+    args = parser.parse_args()
+
+    buffers = FrameBuffers()
+    for client_id, frames in load_sessions(args.frames_dir).items():
+        session = DetectorSession(client_id, buffers=buffers, motion_gate=False, result_cache=False)
+        recorder = LandmarkRecorder(os.path.join(args.output_dir, client_id), client_id)
+        for index, frame_bytes in enumerate(frames):
+            img = decode_frame_rgb(frame_bytes, buffers)
+            if img is None:
+                continue
+            recorder.append(index * 1000.0 / args.fps, detect_landmarks(img, session))
+        recorder.close()
+        session.close()
+        print(f"{client_id}: {recorder.frames} frames")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+# Replays landmark streams through detect_gesture and maybe_emit_gesture on the recorded clock,
+# far faster than real time. Threshold flags override the server defaults for the run.
+#
+#   python meresek/landmark_replay.py streams/ --swipe-min-displacement 0.06 --output result.json
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+import api.routes as routes
+import models.hand_detectation as hand_detectation
+from api.landmark_stream import LandmarkStream, find_streams, replay_stream
+from models.hand_detectation import HandGestureDetector
+
+OVERRIDES = {
+    "swipe_min_displacement": (hand_detectation, "SWIPE_MIN_DISPLACEMENT"),
+    "swipe_min_velocity": (hand_detectation, "SWIPE_MIN_VELOCITY"),
+    "min_confidence": (routes, "MIN_CONFIDENCE"),
+    "hold_seconds": (routes, "GESTURE_HOLD_SECONDS"),
+    "cooldown_seconds": (routes, "GESTURE_COOLDOWN_SECONDS"),
+    "command_mode_seconds": (routes, "COMMAND_MODE_WINDOW_SECONDS"),
+}
+
+
+async def replay_all(paths):
+    sessions = {}
+    for path in paths:
+        stream = LandmarkStream(path)
+        client_id = os.path.basename(os.path.normpath(path))
+        events = await replay_stream(stream, HandGestureDetector(), routes.maybe_emit_gesture, client_id)
+        routes.client_sessions.remove(client_id)
+        counts = {}
+        for _, event in events:
+            counts[event] = counts.get(event, 0) + 1
+        sessions[client_id] = {
+            "frames": len(stream),
+            "events": counts,
+            "timeline": [{"ms": ts, "gesture": event} for ts, event in events],
+        }
+    return sessions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay landmark streams through the gesture rules.")
+    parser.add_argument("streams", nargs="+", help="stream directories or directories containing them")
+    for name in OVERRIDES:
+        parser.add_argument("--" + name.replace("_", "-"), type=float)
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    applied = {}
+    for name, (module, attribute) in OVERRIDES.items():
+        value = getattr(args, name)
+        if value is not None:
+            setattr(module, attribute, value)
+            applied[attribute] = value
+
+    paths = [path for root in args.streams for path in find_streams(root)]
+    started = time.perf_counter()
+    sessions = asyncio.run(replay_all(paths))
+    elapsed = time.perf_counter() - started
+
+    frames = sum(session["frames"] for session in sessions.values())
+    totals = {}
+    for session in sessions.values():
+        for event, count in session["events"].items():
+            totals[event] = totals.get(event, 0) + count
+    report = json.dumps({
+        "overrides": applied,
+        "sessions": len(sessions),
+        "frames": frames,
+        "seconds": elapsed,
+        "frames_per_second": frames / elapsed if elapsed else 0.0,
+        "events": totals,
+        "per_session": sessions,
+    }, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report)
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+import os
+import sys
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+from api.process import FrameBuffers, decode_frame_rgb
+
+FRAMES = 200
+
+
+def make_jpeg(path=None, width=1280, height=720):
+    if path:
+        with open(path, "rb") as f:
+            return f.read()
+    rng = np.random.default_rng(0)
+    img = cv2.GaussianBlur(rng.integers(0, 255, (height, width, 3), dtype=np.uint8), (15, 15), 0)
+    return cv2.imencode(".jpg", img)[1].tobytes()
+
+
+def old_path(frame_bytes, buffers):
+    img = cv2.imdecode(np.frombuffer(frame_bytes, np.uint8), cv2.IMREAD_COLOR)
+    img = cv2.flip(img, 1)
+    return cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+
+
+def new_path(frame_bytes, buffers):
+    return decode_frame_rgb(frame_bytes, buffers)
+
+
+def measure(fn, frame_bytes):
+    buffers = FrameBuffers()
+    fn(frame_bytes, buffers)
+
+    # numpy reports its data buffers to tracemalloc, OpenCV outputs are numpy arrays
+    tracemalloc.start()
+    peaks = []
+    for _ in range(FRAMES):
+        tracemalloc.reset_peak()
+        base, _ = tracemalloc.get_traced_memory()
+        fn(frame_bytes, buffers)
+        _, peak = tracemalloc.get_traced_memory()
+        peaks.append(peak - base)
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    for _ in range(FRAMES):
+        fn(frame_bytes, buffers)
+    elapsed_ms = (time.perf_counter() - start) * 1000.0 / FRAMES
+    return sum(peaks) / len(peaks), elapsed_ms
+
+
+if __name__ == "__main__":
+    frame_bytes = make_jpeg(sys.argv[1] if len(sys.argv) > 1 else None)
+    for name, fn in (("decode+flip+cvtColor", old_path), ("decode_frame_rgb", new_path)):
+        peak, elapsed_ms = measure(fn, frame_bytes)
+        print(f"{name:24s} {peak / 1024:10.1f} KiB peak alloc/frame {elapsed_ms:8.3f} ms/frame")
@@ -0,0 +1,237 @@
+# Replays recorded JPEG frame sequences through the frame pipeline and reports latency as JSON.
+#
+#   python meresek/replay_benchmark.py recordings/ --mode both --fps 10 --output result.json
+#   python meresek/replay_benchmark.py recordings/ --baseline baseline.json
+#
+# `recordings/` holds one sub-directory of JPEG frames per recorded session (or the JPEGs directly),
+# frames are replayed in file name order, as fast as possible but on the recorded clock (frame index / --fps),
+# so hold, cooldown and swipe velocity see the recording's timing. Each mode runs in its own process,
+# which keeps its peak RSS apart. The api mode needs httpx for FastAPI's TestClient.
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+from api.process import FrameBuffers, classify_landmarks, decode_frame_rgb, detect_landmarks
+from api.sessions import DetectorSession
+
+FRAME_EXTENSIONS = (".jpg", ".jpeg")
+RECORDED_FPS = 10.0
+
+
+def load_sessions(root):
+    sessions = {}
+    entries = sorted(os.listdir(root))
+    frames = [os.path.join(root, name) for name in entries if name.lower().endswith(FRAME_EXTENSIONS)]
+    if frames:
+        sessions[os.path.basename(os.path.normpath(root))] = frames
+    for name in entries:
+        path = os.path.join(root, name)
+        if os.path.isdir(path):
+            session_frames = sorted(
+                os.path.join(path, f) for f in os.listdir(path) if f.lower().endswith(FRAME_EXTENSIONS)
+            )
+            if session_frames:
+                sessions[name] = session_frames
+
+    loaded = {}
+    for client_id, paths in sessions.items():
+        loaded[client_id] = []
+        for path in paths:
+            with open(path, "rb") as f:
+                loaded[client_id].append(f.read())
+    return loaded
+
+
+def interleave(sessions):
+    # round-robin over sessions, the way concurrent presenters reach the server
+    longest = max(len(frames) for frames in sessions.values())
+    for i in range(longest):
+        for client_id, frames in sessions.items():
+            if i < len(frames):
+                yield client_id, i + 1, frames[i]
+
+
+def summarize(samples_ms):
+    if not samples_ms:
+        return None
+    values = np.asarray(samples_ms)
+    return {
+        "count": int(values.size),
+        "mean": float(values.mean()),
+        "p50": float(np.percentile(values, 50)),
+        "p95": float(np.percentile(values, 95)),
+        "p99": float(np.percentile(values, 99)),
+        "max": float(values.max()),
+    }
+
+
+def frame_time(frame_id, fps):
+    # capture time of a frame in seconds on the recorded clock; frame ids start at 1, so it is never 0,
+    # which the server reads as no capture time at all
+    return frame_id / fps
+
+
+def run_direct(sessions, fps=RECORDED_FPS):
+    from api.routes import maybe_emit_gesture
+
+    stages = {"decode": [], "detect_hands": [], "detect_gesture": [], "maybe_emit_gesture": [], "end_to_end": []}
+    buffers = FrameBuffers()
+    # every frame goes through the landmarker, the motion gate and the result cache would skip some
+    detector_sessions = {
+        client_id: DetectorSession(client_id, buffers=buffers, motion_gate=False, result_cache=False)
+        for client_id in sessions
+    }
+    loop = asyncio.new_event_loop()
+    gestures = 0
+    frames = 0
+
+    started = time.perf_counter()
+    for client_id, frame_id, frame_bytes in interleave(sessions):
+        session = detector_sessions[client_id]
+        ts = frame_time(frame_id, fps)
+        t0 = time.perf_counter()
+        img = decode_frame_rgb(frame_bytes, buffers)
+        t1 = time.perf_counter()
+        if img is None:
+            continue
+        landmarks = detect_landmarks(img, session, ts)
+        t2 = time.perf_counter()
+        gesture, _, confidence = classify_landmarks(session, landmarks, ts)
+        t3 = time.perf_counter()
+        event = loop.run_until_complete(maybe_emit_gesture(client_id, gesture, confidence, now=ts))
+        t4 = time.perf_counter()
+
+        stages["decode"].append((t1 - t0) * 1000.0)
+        stages["detect_hands"].append((t2 - t1) * 1000.0)
+        stages["detect_gesture"].append((t3 - t2) * 1000.0)
+        stages["maybe_emit_gesture"].append((t4 - t3) * 1000.0)
+        stages["end_to_end"].append((t4 - t0) * 1000.0)
+        frames += 1
+        gestures += int(event is not None)
+    elapsed = time.perf_counter() - started
+
+    loop.close()
+    for session in detector_sessions.values():
+        session.close()
+    return {
+        "frames": frames,
+        "gestures": gestures,
+        "fps": frames / elapsed if elapsed else 0.0,
+        "stages": {name: summarize(samples) for name, samples in stages.items()},
+    }
+
+
+def run_api(sessions, fps=RECORDED_FPS):
+    from fastapi.testclient import TestClient
+    import main
+
+    def replay_session(client, client_id, frames):
+        # a presenter's frames go one after the other, the sessions run side by side like concurrent clients,
+        # so the batch scheduler gets to see more than one frame at a time
+        samples = []
+        for frame_id, frame_bytes in enumerate(frames, start=1):
+            t0 = time.perf_counter()
+            capture_ts = frame_time(frame_id, fps) * 1000.0
+            response = client.post(
+                "/process_frame",
+                params={"clientId": client_id, "frameId": frame_id, "captureTs": capture_ts},
+                files={"frame": ("frame.jpg", frame_bytes, "image/jpeg")},
+            )
+            body = response.json()
+            samples.append(((time.perf_counter() - t0) * 1000.0, body.get("message") or body.get("error", "error")))
+        return samples
+
+    latencies = []
+    statuses = {}
+    with TestClient(main.app) as client:
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=len(sessions)) as pool:
+            replays = [pool.submit(replay_session, client, client_id, frames) for client_id, frames in sessions.items()]
+            for replay in replays:
+                for latency, status in replay.result():
+                    latencies.append(latency)
+                    statuses[status] = statuses.get(status, 0) + 1
+        elapsed = time.perf_counter() - started
+        batches = client.get("/batch_stats").json()
+
+    batches.pop("recent", None)
+    return {
+        "frames": len(latencies),
+        "fps": len(latencies) / elapsed if elapsed else 0.0,
+        "statuses": statuses,
+        "batches": batches,
+        "stages": {"end_to_end": summarize(latencies)},
+    }
+
+
+def compare(result, baseline):
+    deltas = {}
+    for mode, data in result["modes"].items():
+        base = baseline.get("modes", {}).get(mode)
+        if not base:
+            continue
+        deltas[mode] = {"fps": data["fps"] - base["fps"]}
+        if "peak_rss_mb" in data and "peak_rss_mb" in base:
+            deltas[mode]["peak_rss_mb"] = data["peak_rss_mb"] - base["peak_rss_mb"]
+        for stage, stats in data["stages"].items():
+            base_stats = base["stages"].get(stage)
+            if stats and base_stats:
+                deltas[mode][stage] = {p: stats[p] - base_stats[p] for p in ("p50", "p95", "p99")}
+    return deltas
+
+
+def run_mode(mode, frames_dir, fps):
+    # runs in a fresh process, so ru_maxrss is this mode's peak alone (KiB on Linux)
+    sessions = load_sessions(frames_dir)
+    result = run_direct(sessions, fps) if mode == "direct" else run_api(sessions, fps)
+    result["peak_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded frames through the gesture pipeline.")
+    parser.add_argument("frames_dir")
+    parser.add_argument("--mode", choices=("direct", "api", "both"), default="both")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--baseline", help="earlier JSON report to diff against")
+    parser.add_argument("--fps", type=float, default=RECORDED_FPS, help="capture rate the frames were recorded at")
+    args = parser.parse_args()
+
+    sessions = load_sessions(args.frames_dir)
+    if not sessions:
+        parser.error(f"no JPEG frames found in {args.frames_dir}")
+
+    result = {
+        "sessions": len(sessions),
+        "frames": sum(len(frames) for frames in sessions.values()),
+        "modes": {},
+    }
+    modes = ("direct", "api") if args.mode == "both" else (args.mode,)
+    context = multiprocessing.get_context("spawn")
+    for mode in modes:
+        with context.Pool(1) as pool:
+            result["modes"][mode] = pool.apply(run_mode, (mode, args.frames_dir, args.fps))
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            result["delta_vs_baseline"] = compare(result, json.load(f))
+
+    report = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report)
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    main()
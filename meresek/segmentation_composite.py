@@ -0,0 +1,87 @@
+import os
+import sys
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+from models.segmentation import BackgroundCompositor
+
+FRAMES = 200
+MASK_WIDTHS = (0, 640, 256)
+
+
+def make_inputs(width=1280, height=720):
+    rng = np.random.default_rng(0)
+    frame = cv2.GaussianBlur(rng.integers(0, 255, (height, width, 3), dtype=np.uint8), (15, 15), 0)
+    background = cv2.GaussianBlur(rng.integers(0, 255, (1080, 1920, 3), dtype=np.uint8), (31, 31), 0)
+    # soft person-shaped blob, like the float32 selfie segmentation output
+    mask = np.zeros((height, width), np.float32)
+    cv2.ellipse(mask, (width // 2, height), (width // 5, height * 3 // 4), 0, 0, 360, 1.0, -1)
+    mask = cv2.GaussianBlur(mask, (0, 0), 12)
+    return frame, background, mask
+
+
+class LegacyComposite:
+    # the previous segment_background blend: resize every frame and blend in float64
+    def __init__(self, background):
+        self.background = background
+
+    def __call__(self, frame, mask):
+        h, w, _ = frame.shape
+        self.background = cv2.resize(self.background, (w, h))
+        mask = mask[:, :, np.newaxis]
+        return (frame * mask + self.background * (1 - mask)).astype(np.uint8)
+
+
+class CachedComposite:
+    # the compositor path, with the mask taken at mask_width and upsampled like person_alpha does
+    def __init__(self, background, mask_width):
+        self.compositor = BackgroundCompositor(background)
+        self.mask_width = mask_width
+
+    def __call__(self, frame, mask):
+        h, w = frame.shape[:2]
+        if self.mask_width and w > self.mask_width:
+            # stands in for the model running on the downscaled frame
+            mask = cv2.resize(mask, (self.mask_width, round(h * self.mask_width / w)), interpolation=cv2.INTER_AREA)
+        return self.compositor.composite(frame, self.compositor.alpha(mask, w, h))
+
+
+def measure(fn, frame, mask):
+    fn(frame, mask)
+
+    tracemalloc.start()
+    peaks = []
+    for _ in range(FRAMES):
+        tracemalloc.reset_peak()
+        base, _ = tracemalloc.get_traced_memory()
+        fn(frame, mask)
+        _, peak = tracemalloc.get_traced_memory()
+        peaks.append(peak - base)
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    for _ in range(FRAMES):
+        fn(frame, mask)
+    elapsed_ms = (time.perf_counter() - start) * 1000.0 / FRAMES
+    return sum(peaks) / len(peaks), elapsed_ms
+
+
+if __name__ == "__main__":
+    frame, background, mask = make_inputs()
+    if len(sys.argv) > 1:
+        background = cv2.imread(sys.argv[1])
+    reference = LegacyComposite(background)(frame, mask).astype(np.int16)
+
+    paths = [("legacy float64 blend", LegacyComposite(background))]
+    paths += [
+        (f"compositor mask {mask_width or 'full'}", CachedComposite(background, mask_width))
+        for mask_width in MASK_WIDTHS
+    ]
+    for name, fn in paths:
+        error = np.abs(fn(frame, mask).astype(np.int16) - reference).max()
+        peak, elapsed_ms = measure(fn, frame, mask)
+        print(f"{name:24s} {peak / 1024:10.1f} KiB peak alloc/frame {elapsed_ms:8.3f} ms/frame  max diff {error}")
@@ -0,0 +1,35 @@
+from datetime import datetime
+
+from sqlalchemy import create_engine, select
+
+from db import client_sessions, metadata, write_client_rows
+
+
+def test_last_seen_row_does_not_overwrite_consent(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'gesture.db'}")
+    metadata.create_all(engine)
+    consented_at = datetime(2026, 1, 1, 12, 0)
+    seen_at = datetime(2026, 1, 1, 12, 5)
+
+    write_client_rows(engine, [
+        {
+            "client_id": "a",
+            "consent_accepted": True,
+            "consent_at": consented_at,
+            "user_agent": "ua",
+            "updated_at": consented_at,
+        },
+    ])
+    write_client_rows(engine, [
+        {"client_id": "a", "last_seen_at": seen_at, "updated_at": seen_at},
+        {"client_id": "b", "last_seen_at": seen_at, "updated_at": seen_at},
+    ])
+
+    with engine.connect() as conn:
+        rows = {row.client_id: row for row in conn.execute(select(client_sessions))}
+    assert rows["a"].consent_accepted is True
+    assert rows["a"].consent_at == consented_at
+    assert rows["a"].user_agent == "ua"
+    assert rows["a"].last_seen_at == seen_at
+    assert rows["b"].consent_accepted is False
+    assert rows["b"].last_seen_at == seen_at
@@ -0,0 +1,97 @@
+import asyncio
+import os
+import socket
+
+import pytest
+
+from api.event_bus import InProcessEventBus, IpcEventBus, RedisEventBus
+
+
+class Inbox:
+    def __init__(self):
+        self.events = []
+        self.arrived = asyncio.Event()
+
+    async def deliver(self, client_id, event):
+        self.events.append((client_id, event))
+        self.arrived.set()
+
+    async def next(self, timeout=2.0):
+        await asyncio.wait_for(self.arrived.wait(), timeout)
+        self.arrived.clear()
+        return self.events[-1]
+
+
+def test_inprocess_delivers_only_claimed_clients():
+    async def scenario():
+        inbox = Inbox()
+        bus = InProcessEventBus()
+        await bus.start(inbox.deliver)
+        await bus.publish("a", {"gesture": "Pointing"})
+        await bus.claim("a")
+        await bus.publish("a", {"gesture": "Swipe Left"})
+        await bus.release("a")
+        await bus.publish("a", {"gesture": "Swipe Right"})
+        assert inbox.events == [("a", {"gesture": "Swipe Left"})]
+        assert bus.stats()["published"] == 3
+
+    asyncio.run(scenario())
+
+
+def test_ipc_routes_events_to_the_worker_holding_the_client(tmp_path):
+    async def scenario():
+        holder_inbox, other_inbox = Inbox(), Inbox()
+        holder, other = IpcEventBus(str(tmp_path)), IpcEventBus(str(tmp_path))
+        # both buses live in this process, the socket name stands in for the worker pid
+        holder.path = os.path.join(tmp_path, "1.sock")
+        other.path = os.path.join(tmp_path, "2.sock")
+        await holder.start(holder_inbox.deliver)
+        await other.start(other_inbox.deliver)
+
+        # a worker that died without unlinking its socket
+        dead = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        dead_path = os.path.join(tmp_path, "3.sock")
+        dead.bind(dead_path)
+        dead.close()
+
+        await holder.claim("presenter")
+        await other.publish("presenter", {"gesture": "Pointing"})
+        assert await holder_inbox.next() == ("presenter", {"gesture": "Pointing"})
+        assert other_inbox.events == []
+        assert not os.path.exists(dead_path)
+        # the delivery task was held until it finished
+        await asyncio.sleep(0)
+        assert not holder.deliveries
+
+        await holder.stop()
+        await other.stop()
+        assert os.listdir(tmp_path) == []
+
+    asyncio.run(scenario())
+
+
+def test_redis_claim_publish_release_with_a_stand_in():
+    fakeredis = pytest.importorskip("fakeredis")
+
+    async def scenario():
+        server = fakeredis.FakeServer()
+        holder_inbox, other_inbox = Inbox(), Inbox()
+        holder = RedisEventBus(client=fakeredis.FakeAsyncRedis(server=server))
+        other = RedisEventBus(client=fakeredis.FakeAsyncRedis(server=server))
+        await holder.start(holder_inbox.deliver)
+        await other.start(other_inbox.deliver)
+
+        await holder.claim("presenter")
+        await other.publish("presenter", {"gesture": "Swipe Right"})
+        assert await holder_inbox.next() == ("presenter", {"gesture": "Swipe Right"})
+
+        await holder.release("presenter")
+        await other.publish("presenter", {"gesture": "Swipe Left"})
+        await asyncio.sleep(0.3)
+        assert holder_inbox.events == [("presenter", {"gesture": "Swipe Right"})]
+        assert other_inbox.events == []
+
+        await holder.stop()
+        await other.stop()
+
+    asyncio.run(scenario())
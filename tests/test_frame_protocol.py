@@ -0,0 +1,45 @@
+import pytest
+
+from api.frame_protocol import (
+    FRAME_HEADER, WS_MAX_FRAME_CREDITS, FrameCredits, build_frame_message, is_frame_message,
+    parse_frame_message, welcome_message,
+)
+
+
+def test_frame_message_roundtrip():
+    message = build_frame_message(2**32 + 7, b"\xff\xd8jpeg", 1500.25)
+    assert is_frame_message(message)
+    seq, capture_ts, payload = parse_frame_message(message)
+    # seq is a u32 on the wire
+    assert seq == 7
+    assert capture_ts == 1500.25
+    assert bytes(payload) == b"\xff\xd8jpeg"
+
+
+@pytest.mark.parametrize("message", [
+    build_frame_message(1, b"")[:FRAME_HEADER.size],
+    b"GVFX" + build_frame_message(1, b"jpeg")[4:],
+    build_frame_message(1, b"jpeg")[:4] + b"\x09" + build_frame_message(1, b"jpeg")[5:],
+])
+def test_malformed_frame_messages_are_rejected(message):
+    with pytest.raises(ValueError):
+        parse_frame_message(message)
+
+
+def test_credits_bound_the_frames_in_flight():
+    credits = FrameCredits(2)
+    assert credits.take()
+    assert credits.take()
+    assert not credits.take()
+    credits.give_back()
+    assert credits.take()
+    for _ in range(5):
+        credits.give_back()
+    assert credits.in_flight == 0
+
+
+def test_welcome_clamps_the_requested_credits():
+    assert welcome_message({"credits": 3})["credits"] == 3
+    assert welcome_message({"credits": 10**6})["credits"] == WS_MAX_FRAME_CREDITS
+    assert welcome_message({"credits": 0})["credits"] >= 1
+    assert welcome_message({"credits": "many"})["credits"] >= 1
@@ -0,0 +1,39 @@
+import asyncio
+
+from api.ingest import FRAME_DROPPED, FRAME_ID_RESTART_GAP, FRAME_PROCESSED, FRAME_STALE, FrameMailbox, IngestQueue
+
+
+def test_mailbox_accepts_newer_and_restarted_frame_ids():
+    box = FrameMailbox()
+    assert box.accepts(None)
+    assert box.accepts(5)
+    box.last_frame_id = 500
+    assert box.accepts(None)
+    assert box.accepts(501)
+    assert not box.accepts(500)
+    assert not box.accepts(500 - FRAME_ID_RESTART_GAP)
+    # far behind: the client restarted its counter
+    assert box.accepts(500 - FRAME_ID_RESTART_GAP - 1)
+
+
+def test_latest_frame_wins_and_discard_drops_the_waiting_one():
+    async def scenario():
+        async def handler(client_id, payload):
+            await asyncio.sleep(0.01)
+            return payload
+
+        queue = IngestQueue(handler)
+        first = queue.offer("c", 1, "first", wait=True)
+        await asyncio.sleep(0)
+        superseded = queue.offer("c", 2, "second", wait=True)
+        waiting = queue.offer("c", 3, "third", wait=True)
+        assert queue.offer("c", 3, "again") == FRAME_STALE
+        assert await superseded == (FRAME_DROPPED, None)
+
+        queue.discard("c")
+        assert await first == (FRAME_PROCESSED, "first")
+        assert await waiting == (FRAME_DROPPED, None)
+        assert queue.stats("c") is None
+        assert queue.totals == {"received": 4, "processed": 1, "dropped": 1, "stale": 1}
+
+    asyncio.run(scenario())
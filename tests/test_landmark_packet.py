@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+
+from api.landmark_packet import build_landmark_packet, is_landmark_packet, parse_landmark_packet
+from models.hand_detectation import HandLandmarks
+
+
+def test_landmark_packet_roundtrip():
+    rng = np.random.default_rng(0)
+    landmarks = HandLandmarks(
+        rng.random((2, 21, 3), dtype=np.float32),
+        np.array([1, 0], np.int8),
+        np.array([0.9, 0.75], np.float32),
+    )
+    packet = build_landmark_packet(landmarks, 1234.5)
+    assert is_landmark_packet(packet)
+
+    parsed, capture_ts = parse_landmark_packet(packet)
+    assert capture_ts == 1234.5
+    np.testing.assert_array_equal(parsed.points, landmarks.points)
+    np.testing.assert_array_equal(parsed.handedness, landmarks.handedness)
+    np.testing.assert_array_equal(parsed.scores, landmarks.scores)
+
+
+def test_empty_packet_roundtrip():
+    parsed, capture_ts = parse_landmark_packet(build_landmark_packet(HandLandmarks.empty(), 7.0))
+    assert len(parsed) == 0
+    assert capture_ts == 7.0
+
+
+@pytest.mark.parametrize("mangle", [
+    lambda packet: packet[:10],
+    lambda packet: packet[:-4],
+    lambda packet: b"XXXX" + packet[4:],
+    lambda packet: packet[:4] + b"\x02" + packet[5:],
+    lambda packet: packet[:16] + b"\x05" + packet[17:],
+])
+def test_malformed_packets_are_rejected(mangle):
+    landmarks = HandLandmarks(np.zeros((1, 21, 3), np.float32), np.array([0], np.int8), np.ones(1, np.float32))
+    with pytest.raises(ValueError):
+        parse_landmark_packet(mangle(build_landmark_packet(landmarks, 1.0)))
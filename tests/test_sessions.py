@@ -0,0 +1,26 @@
+import math
+
+from api.sessions import ClientState, SessionRegistry
+
+
+def test_non_finite_capture_ts_falls_back_to_arrival():
+    state = ClientState("client", 4, 100.0)
+    for bad in (float("nan"), float("inf"), float("-inf")):
+        assert state.frame_time(bad, 100.0) == 100.0
+    assert state.clock_offset is None
+
+    # valid frames after the bad ones are still placed by their capture spacing
+    frames = ((5000.0, 101.0), (5100.0, 101.3), (5200.0, 101.2))
+    times = [state.frame_time(capture_ms, arrival) for capture_ms, arrival in frames]
+    assert all(math.isfinite(t) for t in times)
+    assert [round(t - times[0], 3) for t in times] == [0.0, 0.1, 0.2]
+    assert [int(t * 1000) for t in times]
+
+
+def test_cap_never_evicts_the_client_just_added():
+    registry = SessionRegistry(ring_size=4, max_clients=2)
+    for client_id in ("a", "b"):
+        registry.touch(client_id, 1.0).websocket = object()
+    state = registry.touch("c", 2.0)
+    assert registry.get("c") is state
+    assert list(registry.clients) == ["b", "c"]
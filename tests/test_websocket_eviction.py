@@ -0,0 +1,29 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+from api import routes
+from api.event_bus import event_bus
+
+
+def test_evicted_websocket_releases_its_bus_claim(monkeypatch):
+    monkeypatch.setattr(routes.client_sessions, "max_clients", 1)
+    app = FastAPI()
+    app.include_router(routes.router)
+
+    with TestClient(app) as client:
+        with client.websocket_connect("/ws?clientId=first") as first:
+            first.send_text("ping")
+            with client.websocket_connect("/ws?clientId=second") as second:
+                second.send_text("ping")
+                # the cap evicts the older client, which closes its socket
+                try:
+                    first.receive_text()
+                except WebSocketDisconnect:
+                    pass
+                first.close()
+                assert routes.client_sessions.get("first") is None
+                second.send_text("ping")
+                assert "second" in event_bus.local
+            assert "first" not in event_bus.local
+        assert "second" not in event_bus.local